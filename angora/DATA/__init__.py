@@ -1,9 +1,17 @@
 ##encoding=utf-8
 
 from .binarysearch import (find_index, find_lt, find_le, find_gt, find_ge,
-    find_last_true, find_nearest)
+    find_last_true, find_last_true_parallel, find_nearest,
+    find_le_many, find_ge_many, find_nearest_many,
+    find_range_index, find_range, count_range,
+    find_range_index_many, find_range_many, count_range_many)
 from .dtype import OrderedSet, StrSet, IntSet, StrList, IntList
-from .hashutil import md5_str, md5_obj, md5_file, hash_obj
+from .hashutil import (md5_str, md5_obj, md5_file, hash_obj, hash_file,
+    hash_tree, md5_dir, dump_manifest, load_manifest, verify_tree, HashCache,
+    fingerprint_file, find_duplicates, hash_struct)
 from .js import load_js, dump_js, safe_dump_js, prt_js, js2str
+from .memoize import memoize, DiskCache
 from .pk import load_pk, dump_pk, safe_dump_pk, obj2bytestr, bytestr2obj, obj2str, str2obj
+from .sortedindex import SortedIndex
+from .sortedlist import SortedList
 from .timewrapper import timewrapper
\ No newline at end of file
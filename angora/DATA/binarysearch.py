@@ -12,6 +12,10 @@ Module description
 ------------------
     This module is provide methods for searching item in a sorted list.
     find_last_true() is a magic method, please see function doc str for more info.
+    find_last_true_parallel() does the same job with k probes per round on a pool.
+    find_le_many(), find_ge_many(), find_nearest_many() answer a whole batch of queries
+    against the same sorted array in one call.
+    find_range(), count_range() take every item between lo and hi without copying.
     
     
 Keyword
@@ -27,17 +31,33 @@ Compatibility
     
 Prerequisites
 -------------
-    None
+    None. numpy is optional, if installed the *_many functions use numpy.searchsorted
+    for ndarray input.
 
 
 Import Command
 --------------
     from angora.DATA.binarysearch import (find_index, find_lt, find_le, find_gt, find_ge,
-        find_last_true, find_nearest)
+        find_last_true, find_last_true_parallel, find_nearest,
+        find_le_many, find_ge_many, find_nearest_many,
+        find_range_index, find_range, count_range,
+        find_range_index_many, find_range_many, count_range_many)
 """
 
 from __future__ import print_function
+import itertools
 import bisect
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+is_py2 = (sys.version_info[0] == 2)
+if is_py2:
+    range = xrange
+    zip = itertools.izip
 
 ########################################################################
 # official recepi from doc.python.org                                  #
@@ -130,6 +150,103 @@ def find_last_true(sorted_list, true_criterion):
         else:
             upper = index
             index = int((lower+index)/2.0)
+
+def find_last_true_parallel(sorted_list, true_criterion, k=None, use_process=False, 
+                            pool=None, return_stats=False):
+    """parallel k-ary version of find_last_true(). Instead of testing one index at a time,
+    every round tests k evenly spaced indices between the last known True and the first 
+    known False on a pool, so the number of rounds drops from log2(n) to log(n)/log(k+1).
+    Every index is evaluated at most once.
+    
+    Use it when true_criterion is expensive (CPU heavy or IO bound), and wall clock time
+    matters more than total number of calls.
+    
+    [Args]
+    ------
+        sorted_list: list of items, true_criterion maps it to [True, ..., True, False, ..., False]
+        
+        true_criterion: callable returns True or False. Has to be picklable if use_process=True
+        
+        k: number of probes per round, default is number of cpu
+        
+        use_process: boolean, default False. Use a process pool instead of a thread pool.
+            Threads are fine when true_criterion releases the GIL (IO, hashlib, ...)
+        
+        pool: an existing multiprocessing pool, or concurrent.futures executor (anything
+            has .map method) to use, so repeated searches don't pay for a new pool every
+            call. Then use_process is ignored and the pool is not closed.
+        
+        return_stats: boolean, default False. If True, returns (last_true_item, stats),
+            stats is a dict like {"calls": number of true_criterion calls, "rounds": number
+            of rounds}
+    
+    [Returns]
+    ---------
+        the last item which true_criterion(item) is True
+    
+    multiprocessing is imported here, only when needed, so the module still imports 
+    where it's not available (IronPython).
+    """
+    if k is None:
+        from multiprocessing import cpu_count
+        k = cpu_count()
+    k = max(int(k), 1)
+    
+    own_pool = pool is None
+    if own_pool:
+        if use_process:
+            from multiprocessing import Pool as ProcessPool
+            pool = ProcessPool(k)
+        else:
+            from multiprocessing.dummy import Pool as ThreadPool
+            pool = ThreadPool(k)
+    
+    stats = {"calls": 0, "rounds": 0}
+    memo = dict()
+    def evaluate(indices):
+        indices = [ind for ind in sorted(set(indices)) if ind not in memo]
+        if indices:
+            # list(), executor.map returns an iterator
+            results = list(pool.map(true_criterion, [sorted_list[ind] for ind in indices]))
+            memo.update(zip(indices, results))
+            stats["calls"] += len(indices)
+            stats["rounds"] += 1
+    
+    try:
+        lower, upper = 0, len(sorted_list) - 1
+        evaluate([lower, upper])
+        
+        # exam first item, if not true, then impossible to find result
+        if not memo[lower]:
+            raise ValueError
+        
+        # exam last item, if true, it is the one.
+        if memo[upper]:
+            lower = upper
+        
+        # invariant: true_criterion at lower is True, at upper is False
+        while (upper - lower) > 1:
+            gap = upper - lower
+            probes = sorted(set(lower + (gap * j) // (k + 1) for j in range(1, k + 1)))
+            probes = [ind for ind in probes if lower < ind < upper]
+            if not probes:
+                probes = [lower + 1]
+            evaluate(probes)
+            for ind in probes:
+                if memo[ind]:
+                    lower = ind
+                else:
+                    upper = ind
+                    break
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+    
+    if return_stats:
+        return sorted_list[lower], stats
+    else:
+        return sorted_list[lower]
             
 def find_nearest(array, x):
     """find the nearest item of x from sorted array
@@ -146,6 +263,248 @@ def find_nearest(array, x):
         else:
             return lower
 
+#################
+# Batch queries #
+#################
+
+_raise = object() # default value of "default" argument, means raise ValueError on a miss
+
+def _miss(default):
+    """value to use when a query has no answer
+    """
+    if default is _raise:
+        raise ValueError
+    return default
+
+def _gallop_right(array, x, lo, hi):
+    """bisect.bisect_right(array, x, lo, hi), but probe lo, lo+1, lo+3, lo+7, ... first.
+    For ascending queries the answer is usually close to the previous one, so the walk
+    over the whole batch costs O(n + m) instead of O(m * log(n)).
+    """
+    step, probe = 1, lo
+    while probe < hi and array[probe] <= x:
+        lo = probe + 1
+        probe = lo + step
+        step *= 2
+    return bisect.bisect_right(array, x, lo, min(probe, hi))
+
+def _gallop_left(array, x, lo, hi):
+    """bisect.bisect_left(array, x, lo, hi), galloping version. See _gallop_right
+    """
+    step, probe = 1, lo
+    while probe < hi and array[probe] < x:
+        lo = probe + 1
+        probe = lo + step
+        step *= 2
+    return bisect.bisect_left(array, x, lo, min(probe, hi))
+
+def _search_many(array, queries, gallop):
+    """return the bisect position of every query, in the order of queries.
+    
+    Sorted queries are answered by one merge-walk over array. Unsorted queries are sorted
+    once, walked, then the positions are scattered back to the original order.
+    """
+    if not isinstance(queries, (list, tuple)):
+        queries = list(queries)
+    n = len(array)
+    
+    order = None
+    for a, b in zip(queries, itertools.islice(queries, 1, None)):
+        if a > b:
+            order = sorted(range(len(queries)), key=queries.__getitem__)
+            break
+    
+    positions, i = list(), 0
+    if order is None:
+        for x in queries:
+            i = gallop(array, x, i, n)
+            positions.append(i)
+        return positions
+    else:
+        positions = [0] * len(queries)
+        for ind in order:
+            i = gallop(array, queries[ind], i, n)
+            positions[ind] = i
+        return positions
+
+def _use_numpy(array, use_numpy):
+    if use_numpy is None:
+        return (np is not None) and isinstance(array, np.ndarray)
+    if use_numpy and (np is None):
+        raise ImportError("numpy is not installed")
+    return bool(use_numpy)
+
+def _numpy_pick(array, index, miss_mask, default):
+    """take array[index] and fill the misses with default. A numeric default is stored 
+    in the array's dtype (upcast if needed, e.g. int array and float default). Anything
+    else (None, str, bool, ...) makes an object array, so the misses are default 
+    itself, the same as the pure Python path, instead of TypeError or nan.
+    """
+    if miss_mask.any():
+        if default is _raise:
+            raise ValueError
+        result = array[np.clip(index, 0, len(array) - 1)]
+        fill = np.asarray(default)
+        if (fill.ndim == 0) and (fill.dtype.kind in "iufc") and \
+                (result.dtype.kind in "biufc"):
+            result = result.astype(np.result_type(result.dtype, fill.dtype))
+        else:
+            result = result.astype(object)
+        result[miss_mask] = default
+        return result
+    return array[index]
+    
+def find_le_many(array, queries, default=_raise, use_numpy=None):
+    """batch version of find_le(). Find rightmost value less than or equal to x for every
+    x in queries. 
+    
+    [Args]
+    ------
+        array: sorted list, tuple, array.array or numpy.ndarray
+        
+        queries: iterable of query values, sorted or not. Sorted queries are faster.
+        
+        default: value used for queries having no answer. If not given, ValueError is 
+            raised, the same as find_le()
+        
+        use_numpy: None (default) means use numpy.searchsorted if numpy is installed and
+            array is a ndarray. True/False to force it on/off.
+    
+    [Returns]
+    ---------
+        list of answers in the order of queries (ndarray for the numpy path)
+    """
+    if _use_numpy(array, use_numpy):
+        array = np.asarray(array)
+        index = np.searchsorted(array, np.asarray(queries), side="right") - 1
+        return _numpy_pick(array, index, index < 0, default)
+    
+    return [array[i-1] if i else _miss(default)
+            for i in _search_many(array, queries, _gallop_right)]
+
+def find_ge_many(array, queries, default=_raise, use_numpy=None):
+    """batch version of find_ge(). Find leftmost value greater than or equal to x for every
+    x in queries. Arguments are the same as find_le_many()
+    """
+    if _use_numpy(array, use_numpy):
+        array = np.asarray(array)
+        index = np.searchsorted(array, np.asarray(queries), side="left")
+        return _numpy_pick(array, index, index == len(array), default)
+    
+    n = len(array)
+    return [array[i] if i != n else _miss(default)
+            for i in _search_many(array, queries, _gallop_left)]
+
+def find_nearest_many(array, queries, use_numpy=None):
+    """batch version of find_nearest(). Find the nearest item of x from sorted array for 
+    every x in queries. Ties go to the lower value, the same as find_nearest().
+    """
+    if _use_numpy(array, use_numpy):
+        array = np.asarray(array)
+        queries = np.asarray(queries)
+        upper_index = np.clip(np.searchsorted(array, queries, side="left"), 0, len(array)-1)
+        lower_index = np.clip(upper_index - 1, 0, len(array)-1)
+        lower, upper = array[lower_index], array[upper_index]
+        lower = np.where(upper == queries, upper, lower)
+        return np.where((queries - lower) > (upper - queries), upper, lower)
+    
+    if not isinstance(queries, (list, tuple)):
+        queries = list(queries)
+    first, last = array[0], array[-1]
+    result = list()
+    for x, i in zip(queries, _search_many(array, queries, _gallop_left)):
+        if x <= first:
+            result.append(first)
+        elif x >= last:
+            result.append(last)
+        else:
+            upper = array[i]
+            lower = upper if upper == x else array[i-1]
+            if (x - lower) > (upper - x):
+                result.append(upper)
+            else:
+                result.append(lower)
+    return result
+
+###############
+# Range query #
+###############
+
+def _range_view(array, start, stop):
+    """zero-copy view of array[start:stop]. memoryview for buffer objects like 
+    array.array, bytes, bytearray. ndarray slice is already a view. Others uses 
+    itertools.islice.
+    """
+    if (np is not None) and isinstance(array, np.ndarray):
+        return array[start:stop]
+    if not isinstance(array, (list, tuple)):
+        try:
+            return memoryview(array)[start:stop]
+        except TypeError: # not support buffer protocol
+            pass
+    return itertools.islice(array, start, stop)
+
+def find_range_index(array, lo, hi, inclusive=(True, True)):
+    """return index bounds (start, stop) that array[start:stop] are all items 
+    between lo and hi.
+    
+    [Args]
+    ------
+        array: sorted array
+        
+        lo, hi: lower and upper bound
+        
+        inclusive: (boolean, boolean), whether lo and hi are included. Default both.
+    """
+    if inclusive[0]:
+        start = bisect.bisect_left(array, lo)
+    else:
+        start = bisect.bisect_right(array, lo)
+    if inclusive[1]:
+        stop = bisect.bisect_right(array, hi, start)
+    else:
+        stop = bisect.bisect_left(array, hi, start)
+    return start, stop
+
+def find_range(array, lo, hi, inclusive=(True, True)):
+    """return all items between lo and hi, without copying. For array.array, bytes, 
+    bytearray a memoryview is returned, for numpy.ndarray a ndarray view, for others
+    an itertools.islice iterator.
+    """
+    start, stop = find_range_index(array, lo, hi, inclusive)
+    return _range_view(array, start, stop)
+
+def count_range(array, lo, hi, inclusive=(True, True)):
+    """return number of items between lo and hi
+    """
+    start, stop = find_range_index(array, lo, hi, inclusive)
+    return stop - start
+
+def find_range_index_many(array, windows, inclusive=(True, True)):
+    """batch version of find_range_index(). windows is a list of (lo, hi). All bounds
+    are located in one merge-walk, see find_le_many().
+    """
+    if not isinstance(windows, (list, tuple)):
+        windows = list(windows)
+    lows = [lo for lo, _ in windows]
+    highs = [hi for _, hi in windows]
+    starts = _search_many(array, lows, _gallop_left if inclusive[0] else _gallop_right)
+    stops = _search_many(array, highs, _gallop_right if inclusive[1] else _gallop_left)
+    return [(start, max(start, stop)) for start, stop in zip(starts, stops)]
+
+def find_range_many(array, windows, inclusive=(True, True)):
+    """batch version of find_range()
+    """
+    return [_range_view(array, start, stop) 
+            for start, stop in find_range_index_many(array, windows, inclusive)]
+
+def count_range_many(array, windows, inclusive=(True, True)):
+    """batch version of count_range(). Useful for histogram, for example::
+    
+        count_range_many(array, [(0, 10), (10, 20), (20, 30)], inclusive=(True, False))
+    """
+    return [stop - start for start, stop in find_range_index_many(array, windows, inclusive)]
+
 if __name__ == "__main__":
     from collections import OrderedDict
     import unittest
@@ -194,6 +553,72 @@ if __name__ == "__main__":
             
             self.assertEqual(find_nearest(self.sorted_array, -1), 0)
             self.assertEqual(find_nearest(self.sorted_array, 1000), 999)
+        
+        def test_find_range(self):
+            import array
+            data = [1, 3, 3, 5, 9]
+            self.assertEqual(find_range_index(data, 3, 5), (1, 4))
+            self.assertEqual(find_range_index(data, 3, 5, inclusive=(False, True)), (3, 4))
+            self.assertEqual(find_range_index(data, 6, 2), (4, 4))
+            self.assertListEqual(list(find_range(data, 2, 8)), [3, 3, 5])
+            self.assertEqual(count_range(data, 0, 100), 5)
+            self.assertEqual(count_range(data, 3, 9, inclusive=(True, False)), 3)
+            
+            view = find_range(array.array("d", data), 3, 5)
+            self.assertTrue(isinstance(view, memoryview))
+            self.assertListEqual(view.tolist(), [3.0, 3.0, 5.0])
+            self.assertEqual(bytes(find_range(b"abcdef", ord("b"), ord("d"))), b"bcd")
+            
+            windows = [(5, 10), (0, 3), (3, 5), (10, 0), (-1, 100)]
+            self.assertListEqual(find_range_index_many(data, windows),
+                                 [find_range_index(data, lo, hi) for lo, hi in windows])
+            self.assertListEqual(count_range_many(data, windows, inclusive=(True, False)),
+                                 [count_range(data, lo, hi, inclusive=(True, False)) 
+                                  for lo, hi in windows])
+            self.assertListEqual([list(view) for view in find_range_many(data, windows)],
+                                 [[5, 9], [1, 3, 3], [3, 3, 5], [], [1, 3, 3, 5, 9]])
+        
+        def test_find_many(self):
+            array = [1, 3, 3, 5, 9]
+            for queries in [[0, 1, 2, 3, 4, 6, 9, 10], [10, 4, 0, 9, 3, 2, 6, 1]]:
+                self.assertListEqual(
+                    find_le_many(array, queries, default=None),
+                    [find_le(array, x) if x >= 1 else None for x in queries])
+                self.assertListEqual(
+                    find_ge_many(array, queries, default=None),
+                    [find_ge(array, x) if x <= 9 else None for x in queries])
+                self.assertListEqual(
+                    find_nearest_many(array, queries),
+                    [find_nearest(array, x) for x in queries])
+            self.assertRaises(ValueError, find_le_many, array, [0, 1])
+            self.assertRaises(ValueError, find_ge_many, array, [9, 10])
+            
+            queries = [random.random() * 1000 for _ in range(1000)]
+            self.assertListEqual(
+                find_nearest_many(self.sorted_array, queries),
+                [find_nearest(self.sorted_array, x) for x in queries])
+        
+        @unittest.skipIf(np is None, "numpy is not installed")
+        def test_find_many_numpy(self):
+            for array in [np.array([1, 3, 3, 5, 9]), np.array([1.0, 3.0, 3.0, 5.0, 9.0])]:
+                queries = [10, 4, 0, 9, 3, 2, 6, 1]
+                for default in [None, "n/a", -1, 0.5, float("inf")]:
+                    for method in [find_le_many, find_ge_many]:
+                        result = method(array, queries, default=default)
+                        expect = method(list(array), queries, default=default)
+                        self.assertEqual(len(result), len(expect))
+                        for a, b in zip(result, expect):
+                            if (b is None) or isinstance(b, str):
+                                self.assertIs(a, b)
+                            else:
+                                self.assertEqual(a, b)
+                self.assertListEqual(list(find_le_many(array, [3, 9])), [3, 9])
+                self.assertListEqual(list(find_nearest_many(array, queries)),
+                                     find_nearest_many(list(array), queries))
+                self.assertRaises(ValueError, find_le_many, array, [0, 1])
+                self.assertRaises(ValueError, find_ge_many, array, [9, 10])
+            self.assertIsNone(find_le_many(np.array([1, 3]), [0], default=None)[0])
+            self.assertIsNone(find_le_many(np.array([1.0, 3.0]), [0], default=None)[0])
             
     class PerformanceTest(unittest.TestCase):
         def setUp(self):
@@ -227,5 +652,44 @@ if __name__ == "__main__":
         def test(self):
             value = find_last_true(self.sorted_list, self.true_criterion)
             print("last True value is %s" % value)
+        
+        def test_parallel(self):
+            value = find_last_true(self.sorted_list, self.true_criterion)
+            for k in [1, 2, 4, 16]:
+                seen = list()
+                def true_criterion(item):
+                    seen.append(item)
+                    return item <= 500
+                value_parallel, stats = find_last_true_parallel(
+                    self.sorted_list, true_criterion, k=k, return_stats=True)
+                self.assertEqual(value_parallel, value)
+                self.assertEqual(stats["calls"], len(seen))
+                self.assertEqual(len(seen), len(set(seen))) # no item evaluated twice
+            
+            self.assertEqual(find_last_true_parallel([1, 2, 3], self.true_criterion, k=2), 3)
+            for sorted_list, expect, calls in [([1], 1, 1), ([1, 2], 2, 2), ([1, 501], 1, 2)]:
+                self.assertEqual(find_last_true_parallel(
+                    sorted_list, self.true_criterion, return_stats=True), 
+                    (expect, {"calls": calls, "rounds": 1}))
+        
+        def test_parallel_existing_pool(self):
+            from multiprocessing.dummy import Pool as ThreadPool
+            value = find_last_true(self.sorted_list, self.true_criterion)
+            pool = ThreadPool(4)
+            try:
+                for _ in range(3):
+                    self.assertEqual(find_last_true_parallel(
+                        self.sorted_list, self.true_criterion, pool=pool), value)
+            finally:
+                pool.close()
+                pool.join()
+            try:
+                from concurrent.futures import ThreadPoolExecutor
+            except ImportError:
+                return
+            with ThreadPoolExecutor(4) as executor:
+                self.assertEqual(find_last_true_parallel(
+                    self.sorted_list, self.true_criterion, pool=executor), value)
+            self.assertRaises(ValueError, find_last_true_parallel, [501, 502], self.true_criterion)
             
     unittest.main()
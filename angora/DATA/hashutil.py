@@ -12,8 +12,13 @@ Module description
 ------------------
     This module is re-pack of some hashlib utility functions
         1. md5 a string
-        2. md5 a python object
+        2. md5 a python object, by pickle (fast), or by a canonical structural walk 
+           (stable across processes and insertion order), and a stable 64 bits hash
         3. md5 a file
+        4. md5 / sha1 / sha256 / blake2b a file with a reusable buffer or mmap
+        5. hash a directory tree concurrently, write / verify a JSON Lines manifest
+        6. HashCache, a sqlite cache of file digests, skip unchanged files
+        7. sampled fingerprint of a file, and find duplicate files
 
 
 Keyword
@@ -34,19 +39,38 @@ Prerequisites
 
 Import Command
 --------------
-    from angora.DATA.hashutil import md5_str, md5_obj, md5_file, hash_obj
+    from angora.DATA.hashutil import (md5_str, md5_obj, md5_file, hash_obj, hash_file,
+        hash_tree, md5_dir, dump_manifest, load_manifest, verify_tree, HashCache,
+        fingerprint_file, find_duplicates, hash_struct)
 """
 
 from __future__ import print_function
+import threading
+import datetime
+import binascii
 import hashlib
+import json
 import pickle
+import timeit
+import mmap
 import sys
+import os
 
 is_py2 = (sys.version_info[0] == 2)
 if is_py2:
     pickle_protocol = 2
+    text_type, bytes_type, int_types = unicode, str, (int, long)
 else:
     pickle_protocol = 3
+    text_type, bytes_type, int_types = str, bytes, (int,)
+
+ALGORITHMS = ("md5", "sha1", "sha256", "blake2b") # blake2b requires Python3.6+
+DEFAULT_CHUNK_SIZE = 2**20 # 1MB
+
+def _new_hash(algorithm):
+    if algorithm not in ALGORITHMS:
+        raise ValueError("algorithm has to be one of %s" % (ALGORITHMS,))
+    return hashlib.new(algorithm)
 
 def md5_str(text):
     """return md5 value of a STRING
@@ -55,50 +79,630 @@ def md5_str(text):
     m.update(text.encode("utf-8"))
     return m.hexdigest()
 
-def md5_obj(obj):
+class _StructWriter(object):
+    """Feed a canonical byte encoding of an object to a hasher. Every value is a type 
+    tag plus its content, containers have length prefix, so different structures never
+    give the same bytes. Entries of dict, set and frozenset are sorted by their encoded
+    bytes (dict entries with equal key bytes, like two pickled objects, are then sorted by
+    value bytes), so the result doesn't depend on insertion order or hash seed. Small 
+    tokens are buffered and flushed to the hasher every few thousands, the whole encoding
+    is never in memory.
+    
+    Supported: None, bool, int, float, str, bytes, list, tuple, dict, set, frozenset, 
+    datetime, date, time, timedelta and their subclasses. Anything else is pickled.
+    
+    The encoding is the same in every process and run of the same major Python version.
+    Python2 str is bytes, and is encoded as bytes, use unicode to get the same value as 
+    a Python3 str.
+    """
+    __slots__ = ("hasher", "out")
+    
+    def __init__(self, hasher):
+        self.hasher = hasher
+        self.out = list()
+    
+    def flush(self):
+        if self.out:
+            self.hasher.update(b"".join(self.out))
+            del self.out[:]
+    
+    def encode(self, obj):
+        """canonical bytes of a (small, hashable) object, used as sort key"""
+        t = type(obj)
+        if t is text_type: # the usual dict key, skip a new writer
+            data = obj.encode("utf-8")
+            return b"s%d:%s" % (len(data), data)
+        elif (t is int) or (t in int_types):
+            return b"i%d;" % obj
+        writer = _StructWriter(None)
+        writer.feed(obj)
+        return b"".join(writer.out)
+    
+    def feed(self, obj):
+        append = self.out.append
+        t = type(obj)
+        # exact types first, most common first, then subclasses
+        if t is text_type:
+            data = obj.encode("utf-8")
+            append(b"s%d:" % len(data))
+            append(data)
+        elif (t is int) or (t in int_types):
+            append(b"i%d;" % obj)
+        elif t is float:
+            append(b"f%s;" % repr(obj).encode("ascii"))
+        elif obj is None:
+            append(b"N")
+        elif obj is True:
+            append(b"T")
+        elif obj is False:
+            append(b"F")
+        elif isinstance(obj, (list, tuple)):
+            append((b"l%d:" if isinstance(obj, list) else b"t%d:") % len(obj))
+            feed = self.feed
+            for item in obj:
+                feed(item)
+                if len(self.out) > 4096 and (self.hasher is not None):
+                    self.flush()
+        elif isinstance(obj, dict):
+            append(b"d%d:" % len(obj))
+            encode = self.encode
+            entries = sorted([(encode(key), key) for key in obj], key=_first)
+            if any(a[0] == b[0] for a, b in zip(entries, entries[1:])):
+                entries = sorted([(key_bytes + encode(obj[key]), None) 
+                                  for key_bytes, key in entries], key=_first)
+                self.out.extend(entry for entry, _ in entries)
+            else:
+                for key_bytes, key in entries:
+                    append(key_bytes)
+                    self.feed(obj[key])
+                    if len(self.out) > 4096 and (self.hasher is not None):
+                        self.flush()
+        elif isinstance(obj, (set, frozenset)):
+            append(b"S%d:" % len(obj))
+            self.out.extend(sorted([self.encode(item) for item in obj]))
+        elif isinstance(obj, text_type):
+            self.feed(text_type(obj))
+        elif isinstance(obj, int_types):
+            append(b"i%d;" % obj)
+        elif isinstance(obj, float):
+            self.feed(float(obj))
+        elif isinstance(obj, bytes_type):
+            append(b"b%d:" % len(obj))
+            append(bytes(obj))
+        elif isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+            append(b"D%s;" % obj.isoformat().encode("ascii"))
+        elif isinstance(obj, datetime.timedelta):
+            append(b"R%d,%d,%d;" % (obj.days, obj.seconds, obj.microseconds))
+        else:
+            data = pickle.dumps(obj, protocol = pickle_protocol)
+            append(b"P%d:" % len(data))
+            append(data)
+
+def _first(item):
+    return item[0]
+
+def _feed_struct(obj, hasher):
+    writer = _StructWriter(hasher)
+    writer.feed(obj)
+    writer.flush()
+    return hasher
+
+def hash_struct(obj, bits = 64):
+    """return a stable integer hash of a PYTHON OBJECT, the same in every process and 
+    every run, and for equal dict / set regardless of insertion order. bits is 64 or 
+    128. See _StructWriter for supported types.
+    """
+    if bits not in (64, 128):
+        raise ValueError("bits has to be 64 or 128")
+    if hasattr(hashlib, "blake2b"):
+        hasher = hashlib.blake2b(digest_size = bits // 8)
+    else: # Python2, use the leading bits of md5
+        hasher = hashlib.md5()
+    digest = _feed_struct(obj, hasher).digest()[:bits // 8]
+    return int(binascii.hexlify(digest), 16)
+
+def md5_obj(obj, canonical = False):
     """return md5 value of a PYTHON OBJECT
+    [Args]
+    ------
+        obj: any picklable object
+        
+        canonical: boolean, default False. 
+            False: md5 of the pickle, fast (pickle is C). The value is the same as before.
+                It is NOT stable across processes: a set of str (or a dict built from 
+                one) iterates in PYTHONHASHSEED order, so the same value gives a 
+                different md5 in another run. Equal dict / set with different insertion
+                order may also differ. Don't use it as a persistent key for such data.
+            True: md5 of the canonical structural encoding, see _StructWriter. Equal 
+                dict / set give equal value in every process, and memory stays small, 
+                but it's pure Python, about 2.5 - 3 times slower, see 
+                benchmark_hash_obj(). The value is different from canonical=False.
     """
+    if canonical:
+        return _feed_struct(obj, hashlib.md5()).hexdigest()
     m = hashlib.md5()
     if is_py2:
         m.update( pickle.dumps(obj, protocol = pickle_protocol) )
     else:
         m.update( str(pickle.dumps(obj, protocol = pickle_protocol)).encode("utf-8") )
-        
     return m.hexdigest()
 
-def md5_file(fname, chunk_size = 2**10 ):
-    """return md5 value of a FILE
-    Estimate processing time on:
+def benchmark_hash_obj(obj = None, repeat = 3, enable_verbose = True):
+    """time md5_obj(canonical=False) against md5_obj(canonical=True), returns 
+    (pickle sec, structural sec)
+    """
+    if obj is None:
+        obj = [{"id": i, "name": "item%s" % i, "tags": set(["a", "b", str(i % 7)]), 
+                "score": i * 0.5, "time": datetime.datetime(2015, 1, 1)} 
+               for i in range(20000)]
+    old = min(timeit.repeat(lambda: md5_obj(obj), number=1, repeat=repeat))
+    new = min(timeit.repeat(lambda: md5_obj(obj, canonical=True), number=1, repeat=repeat))
+    if enable_verbose:
+        print("md5_obj: pickle %.6f sec, structural %.6f sec" % (old, new))
+    return old, new
+
+def md5_file(fname, chunk_size = DEFAULT_CHUNK_SIZE):
+    """return md5 value of a FILE, see hash_file()
+    
+    With 1MB chunk, throughput is bounded by md5 itself, see benchmark_hash_file(). The
+    old 1KB chunk spent a lot of time in Python calls, only 0.25GB/s:
         CPU = i7-4600U 2.10GHz - 2.70GHz, RAM = 8.00 GB
-        1 second can process 0.25GB data
             0.59G - 2.43 sec
-            1.3G - 5.68 sec
-            1.9G - 7.72 sec
-            2.5G - 10.32 sec
             3.9G - 16.0 sec
     
     ATTENTION:
         When you md5 a file, if you change the meta data (for example, the title, years information
         in audio, video), then the md5 value gonna change.
     """
-    m = hashlib.md5()
-    with open(fname, "rb") as f:
-        while True:
-            data = f.read(chunk_size)
-            if not data:
-                break
-            m.update(data)
+    return hash_file(fname, "md5", chunk_size)
+
+def hash_file(fname, algorithm = "md5", chunk_size = DEFAULT_CHUNK_SIZE, use_mmap = False):
+    """return hex digest of a FILE
+    [Args]
+    ------
+        fname: file path
+        
+        algorithm: one of "md5", "sha1", "sha256", "blake2b", default "md5"
+        
+        chunk_size: bytes read each time, positive int, default 1MB. The file is read 
+            by readinto() into one preallocated buffer, no new bytes object per chunk.
+        
+        use_mmap: boolean, default False. If True, memory map the file and hash it in 
+            one call, no copy at all. Good for files in page cache.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size has to be positive, got %r" % (chunk_size,))
+    m = _new_hash(algorithm)
+    with open(fname, "rb", 0) as f:
+        if use_mmap and os.fstat(f.fileno()).st_size: # empty file can't be mapped
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                m.update(mm)
+            finally:
+                mm.close()
+        else:
+            buf = bytearray(chunk_size)
+            view = memoryview(buf)
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                m.update(view[:n])
     return m.hexdigest()
 
-def hash_obj(obj):
-    """return integer value from hashing a PYTHON OBJECT
+def benchmark_hash_file(fname = None, size = 2**28, algorithms = ALGORITHMS,
+        chunk_sizes = (2**10, 2**16, 2**20, 2**22), repeat = 3, enable_verbose = True):
+    """time hash_file() across algorithms and chunk sizes (and mmap) on one file. 
+    
+    [Args]
+    ------
+        fname: file to hash. Default None means a temp file of #size random bytes
+        
+        repeat: every setting is timed repeat times, the best one is reported
+    
+    [Returns]
+    ---------
+        result: dict, (algorithm, chunk_size or "mmap") -> GB per second
+    """
+    tmp = None
+    if fname is None:
+        fname = tmp = "benchmark_hash_file.tmp"
+        with open(fname, "wb") as f:
+            block = os.urandom(2**20)
+            for _ in range(size // len(block)):
+                f.write(block)
+    try:
+        gigabyte = os.path.getsize(fname) / 2.0**30
+        result = dict()
+        for algorithm in algorithms:
+            if algorithm not in hashlib.algorithms_available:
+                continue
+            for chunk_size in tuple(chunk_sizes) + ("mmap",):
+                if chunk_size == "mmap":
+                    func = lambda: hash_file(fname, algorithm, use_mmap=True)
+                else:
+                    func = lambda: hash_file(fname, algorithm, chunk_size)
+                timing = min(timeit.repeat(func, number=1, repeat=repeat))
+                result[(algorithm, chunk_size)] = gigabyte / timing
+                if enable_verbose:
+                    print("%-8s %-10s %.3f GB/s" % (algorithm, chunk_size, gigabyte / timing))
+        return result
+    finally:
+        if tmp is not None:
+            os.remove(tmp)
+
+def _list_files(root, errors = None):
+    """list of (relative path, absolute path, size) of all files under root. Relative 
+    path always uses "/", so manifest is portable. Entries that can't be stat'ed, e.g. 
+    a broken symlink, are skipped, and (relative path, message) goes to errors if given.
+    """
+    files = list()
+    for dirname, _, basenames in os.walk(root):
+        for basename in basenames:
+            abspath = os.path.join(dirname, basename)
+            relpath = os.path.relpath(abspath, root).replace(os.sep, "/")
+            try:
+                size = os.path.getsize(abspath)
+            except OSError as e:
+                if errors is not None:
+                    errors.append((relpath, str(e)))
+                continue
+            files.append((relpath, abspath, size))
+    return files
+
+def _hash_files(files, algorithm, workers, chunk_size, errors = None):
+    """hash (relative path, absolute path, size) in a thread pool, largest first, so a 
+    big file doesn't start last and keep one thread busy alone. Yield 
+    (relative path, size, digest) in completion order. Files that can't be read are 
+    skipped, and (relative path, message) goes to errors if given.
+    
+    multiprocessing is imported here, so the module still imports where it's not 
+    available (IronPython).
+    """
+    from multiprocessing.dummy import Pool as ThreadPool
+    
+    files = sorted(files, key=lambda item: item[2], reverse=True)
+    def task(item):
+        relpath, abspath, size = item
+        try:
+            return relpath, size, hash_file(abspath, algorithm, chunk_size)
+        except (IOError, OSError) as e:
+            return relpath, size, e
+    
+    pool = ThreadPool(workers)
+    try:
+        for relpath, size, digest in pool.imap_unordered(task, files):
+            if isinstance(digest, (IOError, OSError)):
+                if errors is not None:
+                    errors.append((relpath, str(digest)))
+                continue
+            yield relpath, size, digest
+    finally:
+        pool.terminate()
+        pool.join()
+
+def hash_tree(root, algorithm = "md5", workers = 4, chunk_size = DEFAULT_CHUNK_SIZE, 
+        errors = None):
+    """hash every file under root concurrently, generator. hashlib releases the GIL
+    while hashing, so threads scale until disk is the bottleneck.
+    [Args]
+    ------
+        root: directory
+        
+        algorithm: see hash_file()
+        
+        workers: number of threads, default 4
+        
+        chunk_size: see hash_file()
+        
+        errors: optional list, (path, message) of every file that can't be stat'ed or 
+            read (broken symlink, permission denied) is appended to it. Those files are 
+            skipped instead of aborting the whole tree.
+    
+    [Yields]
+    --------
+        (path, size, digest), path is relative to root, with "/" as separator. In 
+        completion order, roughly largest file first.
+    """
+    return _hash_files(_list_files(root, errors), algorithm, workers, chunk_size, errors)
+
+def md5_dir(root, workers = 4, errors = None):
+    """return dict, relative path -> md5 value of every file under root, see hash_tree()
+    
+    errors: optional list, (path, message) of unreadable files is appended to it, and
+        they are left out of the dict. Default None means raise IOError if any file 
+        can't be read, so no file is ever silently missing.
+    """
+    collected = list() if errors is None else errors
+    result = dict((path, digest) 
+                  for path, _, digest in hash_tree(root, "md5", workers, errors=collected))
+    if (errors is None) and collected:
+        raise IOError("can't read %s file(s) under %s: %s" % (
+            len(collected), root, ", ".join(sorted(path for path, _ in collected))))
+    return result
+
+def dump_manifest(records, fname):
+    """write (path, size, digest) records to a JSON Lines file, one json per line, as 
+    they come. So it works directly with hash_tree() without holding all records::
+    
+        dump_manifest(hash_tree("data"), "data.jsonl")
+    
+    Returns the number of records.
+    """
+    count = 0
+    with open(fname, "w") as f:
+        for path, size, digest in records:
+            f.write(json.dumps({"path": path, "size": size, "digest": digest}) + "\n")
+            count += 1
+    return count
+
+def load_manifest(fname):
+    """load JSON Lines file dumped by dump_manifest(), return dict path -> (size, digest)
+    """
+    manifest = dict()
+    with open(fname, "r") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                manifest[record["path"]] = (record["size"], record["digest"])
+    return manifest
+
+def verify_tree(root, manifest, algorithm = "md5", workers = 4, chunk_size = DEFAULT_CHUNK_SIZE):
+    """compare files under root against a manifest. Files with a different size are 
+    changed without being hashed.
+    [Args]
+    ------
+        root: directory
+        
+        manifest: dict path -> (size, digest), or the JSON Lines file name
+        
+        algorithm: has to be the same one the manifest was made with
+    
+    [Returns]
+    ---------
+        report: dict of sorted lists of relative path, {"missing": in manifest but not 
+            on disk, "extra": on disk but not in manifest, "changed": size or digest 
+            differs, "unreadable": on disk but can't be stat'ed or read}. All empty 
+            means the tree is verified.
     """
+    if not isinstance(manifest, dict):
+        manifest = load_manifest(manifest)
+    errors = list()
+    on_disk = _list_files(root, errors)
+    found = set(relpath for relpath, _, _ in on_disk)
+    unreadable = set(relpath for relpath, _ in errors)
+    report = {
+        "missing": sorted(set(manifest) - found - unreadable),
+        "extra": sorted(found - set(manifest)),
+        "changed": list(),
+    }
+    to_hash = list()
+    for item in on_disk:
+        relpath, _, size = item
+        if relpath in manifest:
+            if manifest[relpath][0] != size:
+                report["changed"].append(relpath)
+            else:
+                to_hash.append(item)
+    for relpath, _, digest in _hash_files(to_hash, algorithm, workers, chunk_size, errors):
+        if manifest[relpath][1] != digest:
+            report["changed"].append(relpath)
+    report["changed"].sort()
+    report["unreadable"] = sorted(set(relpath for relpath, _ in errors))
+    return report
+
+def _file_key(fname):
+    """(size, mtime_ns, inode) of a file. Any write changes size or mtime, replacing
+    the file changes inode.
+    """
+    st = os.stat(fname)
     if is_py2:
-        return hash( pickle.dumps(obj, protocol = pickle_protocol) )
+        mtime_ns = int(st.st_mtime * 10**9)
     else:
-        return hash( str(pickle.dumps(obj, protocol = pickle_protocol)).encode("utf-8") )
+        mtime_ns = st.st_mtime_ns
+    return st.st_size, mtime_ns, st.st_ino
+
+class HashCache(object):
+    """Persistent cache of file digests in a local sqlite file. An entry is keyed by 
+    (path, algorithm), and only valid while (size, mtime_ns, inode) of the file is the
+    same, so an unchanged file is never read again.
+    
+    [Args]
+    ------
+        db_file: sqlite file, default "hashcache.sqlite3"
+        
+    Usage::
+    
+        with HashCache("hash.sqlite3") as cache:
+            digest = cache.hash_file("movie.mp4", "sha256")
+            cache.hits, cache.misses
+            cache.evict_stale()
+    
+    It's safe to share one HashCache between threads, for example in a thread pool.
+    """
+    def __init__(self, db_file = "hashcache.sqlite3"):
+        import sqlite3 # not every Python build has it, only HashCache needs it
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS hashcache ("
+            "path TEXT, algorithm TEXT, size INTEGER, mtime_ns INTEGER, inode INTEGER, "
+            "digest TEXT, PRIMARY KEY (path, algorithm))")
+        self.connection.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, fname, algorithm = "md5"):
+        """return cached digest if the file is not changed, else None. Never read the file
+        """
+        path = os.path.abspath(fname)
+        key = _file_key(path)
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT size, mtime_ns, inode, digest FROM hashcache "
+                "WHERE path = ? AND algorithm = ?", (path, algorithm)).fetchone()
+            if (row is not None) and (tuple(row[:3]) == key):
+                self.hits += 1
+                return row[3]
+            self.misses += 1
+            return None
+    
+    def hash_file(self, fname, algorithm = "md5", chunk_size = DEFAULT_CHUNK_SIZE):
+        """return hex digest of a FILE, from cache if the file is not changed, else hash it
+        by hash_file() and store it.
+        """
+        digest = self.get(fname, algorithm)
+        if digest is not None:
+            return digest
+        path = os.path.abspath(fname)
+        key = _file_key(path)
+        digest = hash_file(path, algorithm, chunk_size)
+        if _file_key(path) == key: # don't store a digest of a file changed while hashing
+            with self._lock:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO hashcache VALUES (?, ?, ?, ?, ?, ?)", 
+                    (path, algorithm) + key + (digest,))
+                self.connection.commit()
+        return digest
+    
+    def evict_stale(self):
+        """delete entries of files which are removed or changed, returns the number of 
+        entries deleted
+        """
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT path, algorithm, size, mtime_ns, inode FROM hashcache").fetchall()
+            stale = list()
+            for row in rows:
+                try:
+                    if _file_key(row[0]) != tuple(row[2:]):
+                        stale.append(row[:2])
+                except OSError:
+                    stale.append(row[:2])
+            self.connection.executemany(
+                "DELETE FROM hashcache WHERE path = ? AND algorithm = ?", stale)
+            self.connection.commit()
+        return len(stale)
+    
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM hashcache").fetchone()[0]
+    
+    def close(self):
+        self.connection.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+DEFAULT_SAMPLE_SIZE = 2**16 # 64KB
+
+def fingerprint_file(fname, algorithm = "md5", sample_size = DEFAULT_SAMPLE_SIZE):
+    """return a quick hex fingerprint of a FILE: hash of file size plus head, middle and
+    tail samples of sample_size bytes. Only 3 small reads, so it takes milliseconds even
+    for GB files. Different fingerprints mean different files; same fingerprint means
+    maybe same file, unless the file is not larger than 3 * sample_size, then the whole
+    file is hashed and the fingerprint is as good as a full digest.
+    """
+    m = _new_hash(algorithm)
+    with open(fname, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        m.update(str(size).encode("ascii") + b":")
+        if size <= 3 * sample_size:
+            m.update(f.read())
+        else:
+            for offset in (0, (size - sample_size) // 2, size - sample_size):
+                f.seek(offset)
+                m.update(f.read(sample_size))
+    return m.hexdigest()
+
+def find_duplicates(paths, algorithm = "md5", sample_size = DEFAULT_SAMPLE_SIZE, 
+        workers = 4):
+    """find groups of files with identical content, in three rounds, each round only 
+    looks at files still colliding:
+    
+        1. group by size, from os.stat, no read
+        2. group by fingerprint_file(), 3 small reads per file
+        3. group by full hash_file(), only for files larger than 3 * sample_size, 
+           because the fingerprint of a smaller file already covers the whole file.
+    
+    [Args]
+    ------
+        paths: a directory (all files under it), or list of file paths
+        
+        algorithm, sample_size: see fingerprint_file()
+        
+        workers: number of threads for rounds 2 and 3, default 4
+    
+    [Returns]
+    ---------
+        duplicates: list of groups, every group is a sorted list of paths (more than one)
+            with the same content. Groups are sorted. Paths that can't be stat'ed or 
+            read, e.g. a broken symlink, a directory or permission denied, are ignored.
+    """
+    from multiprocessing.dummy import Pool as ThreadPool # not at module level, IronPython
     
+    if isinstance(paths, str) and os.path.isdir(paths):
+        paths = [abspath for _, abspath, _ in _list_files(paths)]
+    
+    def regroup(groups, func):
+        """split every group by func(path), paths that can't be read are dropped"""
+        def task(path):
+            try:
+                return func(path)
+            except (IOError, OSError):
+                return None
+        
+        paths = [path for group in groups for path in group]
+        pool = ThreadPool(workers)
+        try:
+            keys = pool.map(task, paths)
+        finally:
+            pool.terminate()
+            pool.join()
+        new_groups = dict()
+        for path, key in zip(paths, keys):
+            if key is not None:
+                new_groups.setdefault(key, list()).append(path)
+        return [group for group in new_groups.values() if len(group) > 1]
+    
+    sizes, by_size = dict(), dict()
+    for path in paths:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        sizes[path] = size
+        by_size.setdefault(size, list()).append(path)
+    candidates = [group for group in by_size.values() if len(group) > 1]
+    
+    duplicates = regroup(candidates, 
+        lambda path: fingerprint_file(path, algorithm, sample_size))
+    small = [group for group in duplicates if sizes[group[0]] <= 3 * sample_size]
+    large = [group for group in duplicates if sizes[group[0]] > 3 * sample_size]
+    if large:
+        small.extend(regroup(large, lambda path: hash_file(path, algorithm)))
+    return sorted(sorted(group) for group in small)
+
+def hash_obj(obj, canonical = True):
+    """return 64 bits integer value from hashing a PYTHON OBJECT. Unlike builtin hash(),
+    it's not salted. By default it is hash_struct(obj, 64), so equal values give the 
+    same value in every process and run, whatever the dict / set order. 
+    canonical=False hashes the pickle instead, faster but not stable across processes,
+    see md5_obj().
+    """
+    if canonical:
+        return hash_struct(obj, 64)
+    digest = hashlib.md5(pickle.dumps(obj, protocol = pickle_protocol)).digest()
+    return int(binascii.hexlify(digest[:8]), 16)
+
 if __name__ == "__main__":
+    class _Unsortable(object):
+        """instances don't support <, and all pickle to the same bytes"""
+    
     def unit_test():
         print("{:=^40}".format("unit_test"))
         print( md5_str("hello world!") )
@@ -106,4 +710,135 @@ if __name__ == "__main__":
         print( md5_file("__init__.py") )
         print( hash_obj({1,2,3,4}))
         
-    unit_test()
\ No newline at end of file
+        with open(__file__, "rb") as f:
+            data = f.read()
+        for algorithm in ALGORITHMS:
+            if algorithm in hashlib.algorithms_available:
+                expect = hashlib.new(algorithm, data).hexdigest()
+                assert hash_file(__file__, algorithm) == expect
+                assert hash_file(__file__, algorithm, chunk_size=7) == expect
+                assert hash_file(__file__, algorithm, use_mmap=True) == expect
+        with open("empty.tmp", "wb") as f:
+            pass
+        assert hash_file("empty.tmp", use_mmap=True) == hashlib.md5().hexdigest()
+        for chunk_size in (0, -1):
+            try:
+                hash_file("empty.tmp", chunk_size=chunk_size)
+                raise AssertionError("chunk_size=%s should raise" % chunk_size)
+            except ValueError:
+                pass
+        os.remove("empty.tmp")
+        
+        import tempfile, shutil
+        root = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(root, "sub", "deep"))
+            for i, path in enumerate(["a.txt", "sub/b.bin", "sub/deep/c.bin", "d.txt"]):
+                with open(os.path.join(root, *path.split("/")), "wb") as f:
+                    f.write(os.urandom(1000 * i))
+            result = md5_dir(root, workers=3)
+            assert sorted(result) == ["a.txt", "d.txt", "sub/b.bin", "sub/deep/c.bin"]
+            assert result["sub/b.bin"] == md5_file(os.path.join(root, "sub", "b.bin"))
+            
+            manifest = os.path.join(root, "..", "manifest.jsonl")
+            assert dump_manifest(hash_tree(root, "sha256"), manifest) == 4
+            assert verify_tree(root, manifest, "sha256") == \
+                {"missing": [], "extra": [], "changed": [], "unreadable": []}
+            with open(os.path.join(root, "a.txt"), "wb") as f:
+                f.write(b"x")
+            with open(os.path.join(root, "d.txt"), "r+b") as f:
+                f.write(b"x")
+            os.remove(os.path.join(root, "sub", "b.bin"))
+            with open(os.path.join(root, "e.txt"), "wb") as f:
+                pass
+            assert verify_tree(root, load_manifest(manifest), "sha256") == \
+                {"missing": ["sub/b.bin"], "extra": ["e.txt"], "changed": ["a.txt", "d.txt"], 
+                 "unreadable": []}
+            if hasattr(os, "symlink"): # broken symlink is reported, not fatal
+                broken = os.path.join(root, "sub", "broken")
+                os.symlink(os.path.join(root, "no_such_file"), broken)
+                errors = list()
+                assert sorted(path for path, _, _ in hash_tree(root, errors=errors)) == \
+                    ["a.txt", "d.txt", "e.txt", "sub/deep/c.bin"]
+                assert [path for path, _ in errors] == ["sub/broken"]
+                errors = list()
+                assert sorted(md5_dir(root, errors=errors)) == \
+                    ["a.txt", "d.txt", "e.txt", "sub/deep/c.bin"]
+                assert [path for path, _ in errors] == ["sub/broken"]
+                try:
+                    md5_dir(root)
+                    raise AssertionError("md5_dir should raise on unreadable file")
+                except IOError as e:
+                    assert "sub/broken" in str(e)
+                assert verify_tree(root, manifest, "sha256")["unreadable"] == ["sub/broken"]
+                assert find_duplicates([broken, os.path.join(root, "e.txt")]) == []
+                os.remove(broken)
+            os.remove(manifest)
+            
+            db_file = os.path.join(root, "..", "hashcache.sqlite3")
+            with HashCache(db_file) as cache:
+                fname = os.path.join(root, "d.txt")
+                assert cache.get(fname) is None
+                assert cache.hash_file(fname) == md5_file(fname)
+                assert cache.hash_file(fname) == md5_file(fname)
+                assert cache.hash_file(fname, "sha1") == hash_file(fname, "sha1")
+                assert (cache.hits, cache.misses) == (1, 3)
+                with open(fname, "ab") as f:
+                    f.write(b"more")
+                assert cache.get(fname) is None
+                assert cache.hash_file(fname) == md5_file(fname)
+                cache.hash_file(os.path.join(root, "e.txt"))
+                assert (len(cache), cache.evict_stale(), len(cache)) == (3, 1, 2)
+            with HashCache(db_file) as cache: # persistent
+                assert cache.get(fname) == md5_file(fname)
+            os.remove(db_file)
+            
+            def write(path, content):
+                with open(os.path.join(root, path), "wb") as f:
+                    f.write(content)
+                return os.path.join(root, path)
+            shutil.rmtree(root)
+            os.mkdir(root)
+            big = os.urandom(50000)
+            a1, a2 = write("a1", big), write("a2", big)
+            b1 = write("b1", big[:10000] + b"X" + big[10001:]) # same samples and size
+            c1, c2 = write("c1", b"small"), write("c2", b"small")
+            write("d1", b"smalL")
+            e1, e2 = write("e1", b""), write("e2", b"")
+            assert fingerprint_file(a1, sample_size=1000) == \
+                fingerprint_file(b1, sample_size=1000)
+            assert fingerprint_file(c1) == fingerprint_file(c2) != hash_file(c1)
+            assert find_duplicates(root, sample_size=1000) == sorted([[a1, a2], [c1, c2], [e1, e2]])
+            assert find_duplicates([a1, b1, c1], sample_size=1000) == []
+            os.mkdir(os.path.join(root, "dd1"))
+            os.mkdir(os.path.join(root, "dd2")) # same size as dd1, can't be read
+            assert find_duplicates([os.path.join(root, "dd1"), os.path.join(root, "dd2"), 
+                                    c1, c2]) == [[c1, c2]]
+        finally:
+            shutil.rmtree(root)
+        
+        assert md5_obj({"a": 1, "b": [1, 2.0]}, True) == md5_obj({"b": [1, 2.0], "a": 1}, True)
+        assert md5_obj(set(range(100)), True) == md5_obj(set(range(99, -1, -1)), True)
+        assert md5_obj(["1",2,"3",4]) == "d5f9f63a455afee7b8776777bd87aef2" # unchanged
+        assert md5_obj({_Unsortable(): 1, _Unsortable(): 2}, True) == \
+            md5_obj({_Unsortable(): 2, _Unsortable(): 1}, True)
+        assert len(set(md5_obj(obj, True) for obj in [
+            [1, 2], (1, 2), [[1], 2], [1, [2]], ["1", 2], [1.0, 2], {1: 2}, set([1, 2]),
+            [b"1", 2], None, True, 1, [], ""])) == 14
+        assert hash_struct({"x": None}, 128) != hash_struct({"x": None}, 64)
+        assert hash_struct({"x": None}, 128) < 2**128
+        assert hash_struct(datetime.date(2015, 1, 1)) < 2**64
+        
+        import subprocess
+        obj = {"key": set(["alpha", "beta", "gamma"]), "when": datetime.datetime(2015, 1, 1)}
+        code = ("import sys, datetime; sys.path.insert(0, %r); from hashutil import "
+                "hash_obj; print(hash_obj(%r))" % (os.path.dirname(os.path.abspath(__file__)), obj))
+        for seed in ["1", "2", "3"]:
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            out = subprocess.check_output([sys.executable, "-c", code], env=env)
+            assert int(out) == hash_obj(obj) == hash_obj(obj, True)
+        
+    unit_test()
+    if "--benchmark" in sys.argv: # python hashutil.py --benchmark
+        benchmark_hash_file(size = 2**26)
+        benchmark_hash_obj()
\ No newline at end of file
@@ -0,0 +1,437 @@
+##encoding=utf-8
+
+"""
+Copyright (c) 2015 by Sanhe Hu
+------------------------------
+    Author: Sanhe Hu
+    Email: husanhe@gmail.com
+    Lisence: LGPL
+
+
+Module description
+------------------
+    Disk backed memoization, the result of an expensive function call is saved, and
+    returned directly next time, even in another process or another run.
+
+        1. key is md5_obj(canonical=True) of (module.qualified name, args, kwargs), 
+           stable across processes and hash seeds, and independent of kwargs order 
+           and of dict / set order in arguments.
+        2. results are stored as pickle files, or as blobs in a sqlite file. Either way
+           an index in sqlite tracks size, last access time and expire time.
+        3. evict least recently used entries when there are more than max_entries, or
+           more than max_bytes in total. Every entry can expire after ttl seconds.
+        4. a small in-memory LRU in front of the disk, hot results don't touch the disk.
+        5. several processes can share one cache directory. sqlite handles locking,
+           pickle files are written to a temp file then renamed.
+
+    Usage::
+
+        @memoize(cache_dir=".cache", max_bytes=2**30, ttl=24 * 3600)
+        def crawl(url):
+            ...
+
+
+Keyword
+-------
+    cache, memoize, pickle, sqlite
+
+
+Compatibility
+-------------
+    Python2: Yes
+    Python3: Yes
+
+
+Prerequisites
+-------------
+    None
+
+
+Import Command
+--------------
+    from angora.DATA.memoize import memoize, DiskCache
+"""
+
+from __future__ import print_function
+from collections import OrderedDict
+import functools
+import threading
+import tempfile
+import time
+import sys
+import os
+
+try:
+    from .hashutil import md5_obj
+    from .pk import obj2bytestr, bytestr2obj
+except (ValueError, ImportError, SystemError): # run as a script, python memoize.py
+    from hashutil import md5_obj
+    from pk import obj2bytestr, bytestr2obj
+
+is_py2 = (sys.version_info[0] == 2)
+if is_py2:
+    def _replace(src, dst):
+        if os.name == "nt" and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+    blob = buffer
+else:
+    _replace = os.replace
+    blob = bytes
+
+BACKENDS = ("sqlite", "pickle")
+
+class DiskCache(object):
+    """A key value store on disk with LRU, size cap and TTL eviction.
+
+    [Args]
+    ------
+        cache_dir: directory of the cache, created if not exists
+
+        backend: "sqlite" (default) stores values as blobs in cache_dir/cache.sqlite3,
+            "pickle" stores every value as cache_dir/<key>.pk. Use "pickle" for big values.
+
+        max_entries: keep at most this many entries, default None means no limit
+
+        max_bytes: keep at most this many bytes of pickled values, default None means
+            no limit
+
+        ttl: default seconds an entry lives, default None means forever
+    """
+    def __init__(self, cache_dir = ".memoize", backend = "sqlite", max_entries = None,
+            max_bytes = None, ttl = None):
+        if backend not in BACKENDS:
+            raise ValueError("backend has to be one of %s" % (BACKENDS,))
+        self.cache_dir = cache_dir
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        if not os.path.exists(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError: # created by another process
+                pass
+        self.db_file = os.path.join(cache_dir, "cache.sqlite3")
+        self._lock = threading.RLock()
+        self._connection = None
+        self._pid = None
+        self._touched = dict() # key -> access time, not written to sqlite yet
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, size INTEGER, "
+                "accessed REAL, expires REAL, value BLOB)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)")
+            connection.commit()
+
+    def _connect(self):
+        """one connection per process, a connection can't be used after fork"""
+        if self._pid != os.getpid():
+            import sqlite3 # not every Python build has it, keep angora.DATA importable
+            self._connection = sqlite3.connect(self.db_file, timeout=60,
+                                               check_same_thread=False)
+            self._pid = os.getpid()
+            self._touched = dict()
+        return self._connection
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, "%s.pk" % key)
+
+    def get(self, key):
+        """return (True, value) if key is cached and not expired, else (False, None)
+        """
+        return self._get(key)[:2]
+
+    def _get(self, key):
+        """return (True, value, expires) or (False, None, None). Access time is only 
+        remembered, and written in a batch by _flush_touched().
+        """
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT expires, value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False, None, None
+            expires, value = row
+            if (expires is not None) and (expires <= now):
+                self._delete([key])
+                return False, None, None
+            if self.backend == "pickle":
+                try:
+                    with open(self._path(key), "rb") as f:
+                        value = f.read()
+                except (IOError, OSError): # evicted by another process
+                    return False, None, None
+            self._touched[key] = now
+            if len(self._touched) >= 256:
+                self._flush_touched()
+        return True, bytestr2obj(bytes(value)), expires
+
+    def _flush_touched(self):
+        """write remembered access time to sqlite, one transaction"""
+        if self._touched:
+            connection = self._connect()
+            connection.executemany("UPDATE cache SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._touched.items()])
+            connection.commit()
+            self._touched.clear()
+
+    def set(self, key, value, ttl = None):
+        """store value, then evict if over limits. ttl overrides the default ttl.
+        Returns the expire time, None means never.
+        """
+        data = obj2bytestr(value)
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else now + ttl
+        if self.backend == "pickle":
+            fd, temp_fname = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            _replace(temp_fname, self._path(key))
+        with self._lock:
+            connection = self._connect()
+            connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, len(data), now, expires,
+                 blob(data) if self.backend == "sqlite" else None))
+            connection.commit()
+            self.evict()
+        return expires
+
+    def evict(self):
+        """delete expired entries, then least recently used entries until the cache is
+        within max_entries and max_bytes. Returns number of entries deleted.
+        """
+        with self._lock:
+            connection = self._connect()
+            self._flush_touched()
+            keys = [row[0] for row in connection.execute(
+                "SELECT key FROM cache WHERE expires <= ?", (time.time(),))]
+            self._delete(keys)
+            n_deleted = len(keys)
+            if (self.max_entries is None) and (self.max_bytes is None):
+                return n_deleted
+            
+            count, total = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+            def over_limits():
+                return ((self.max_entries is not None) and (count > self.max_entries)) or \
+                    ((self.max_bytes is not None) and (total > self.max_bytes))
+            if not over_limits(): # the usual case, no need to walk the index
+                return n_deleted
+            
+            keys = list()
+            for key, size in connection.execute(
+                    "SELECT key, size FROM cache ORDER BY accessed"):
+                if not over_limits():
+                    break
+                keys.append(key)
+                count -= 1
+                total -= size
+            self._delete(keys)
+        return n_deleted + len(keys)
+
+    def _delete(self, keys):
+        if not keys:
+            return
+        connection = self._connect()
+        connection.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+        connection.commit()
+        if self.backend == "pickle":
+            for key in keys:
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+
+    def clear(self):
+        """delete all entries
+        """
+        with self._lock:
+            self._touched.clear()
+            keys = [row[0] for row in self._connect().execute("SELECT key FROM cache")]
+            self._delete(keys)
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+def memoize(cache_dir = ".memoize", backend = "sqlite", max_entries = None,
+        max_bytes = None, ttl = None, memory_size = 128):
+    """decorator, cache function results on disk, see DiskCache for the arguments.
+
+    [Args]
+    ------
+        memory_size: number of results also kept in memory (per process, LRU),
+            0 to disable. Default 128.
+
+    Arguments and results have to be picklable, and arguments are hashed by 
+    md5_obj(canonical=True), so equal arguments give the same key in every process,
+    whatever the kwargs, dict or set order. The decorated function has
+    .cache (the DiskCache) and .cache_clear().
+    """
+    cache = DiskCache(cache_dir, backend, max_entries, max_bytes, ttl)
+    def decorator(func):
+        name = "%s.%s" % (func.__module__, getattr(func, "__qualname__", func.__name__))
+        memory = OrderedDict() # key -> (expires, value)
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = md5_obj((name, args, kwargs), canonical=True)
+            if memory_size:
+                with lock:
+                    if key in memory:
+                        expires, value = memory.pop(key)
+                        if (expires is None) or (expires > time.time()):
+                            memory[key] = (expires, value) # move to the end
+                            return value
+            hit, value, expires = cache._get(key)
+            if not hit:
+                value = func(*args, **kwargs)
+                expires = cache.set(key, value)
+            if memory_size: # keep the disk expire time, don't restart ttl
+                with lock:
+                    memory[key] = (expires, value)
+                    while len(memory) > memory_size:
+                        memory.popitem(last=False)
+            return value
+
+        def cache_clear():
+            with lock:
+                memory.clear()
+            cache.clear()
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+if __name__ == "__main__":
+    import subprocess
+    import unittest
+    import shutil
+
+    class MemoizeUnittest(unittest.TestCase):
+        def setUp(self):
+            self.cache_dir = tempfile.mkdtemp()
+
+        def tearDown(self):
+            shutil.rmtree(self.cache_dir)
+
+        def test_memoize(self):
+            for backend in BACKENDS:
+                calls = list()
+                @memoize(os.path.join(self.cache_dir, backend), backend, memory_size=2)
+                def add(a, b=0):
+                    calls.append((a, b))
+                    return {"sum": a + b}
+                self.assertEqual(add(1, b=2), {"sum": 3})
+                self.assertEqual(add(1, b=2), {"sum": 3})
+                self.assertEqual(add(a=1, b=2), {"sum": 3})
+                self.assertEqual(len(calls), 2) # add(1, b=2) and add(a=1, b=2)
+
+                add.cache_clear()
+                self.assertEqual(add(1, b=2), {"sum": 3})
+                self.assertEqual(len(calls), 3)
+
+                # a new process would see only the disk
+                @memoize(os.path.join(self.cache_dir, backend), backend, memory_size=0)
+                def add(a, b=0):
+                    calls.append((a, b))
+                self.assertEqual(add(1, b=2), {"sum": 3})
+                self.assertEqual(len(calls), 3)
+
+        def test_key_order(self):
+            calls = list()
+            @memoize(self.cache_dir, memory_size=0)
+            def f(a, b, **kwargs):
+                calls.append((a, b))
+                return sorted(kwargs)
+            self.assertEqual(f(a=1, b=2, c=3, d=4), ["c", "d"])
+            self.assertEqual(f(b=2, a=1, d=4, c=3), ["c", "d"])
+            self.assertEqual(f({"x": 1, "y": 2}, set("ab")), [])
+            self.assertEqual(f({"y": 2, "x": 1}, set("ba")), [])
+            self.assertEqual(len(calls), 2)
+
+        def test_hash_seed(self):
+            """two processes with different hash seeds share one cache"""
+            code = "\n".join([
+                "import sys",
+                "sys.path.insert(0, %r)" % os.path.dirname(os.path.abspath(__file__)),
+                "from memoize import memoize",
+                "calls = list()",
+                "@memoize(%r, memory_size=0)" % self.cache_dir,
+                "def f(tags, groups):",
+                "    calls.append(1)",
+                "    return len(tags)",
+                "f(set(['alpha', 'beta', 'gamma']), {'a': set(['x', 'y', 'z'])})",
+                "print(len(calls))",
+            ])
+            outputs = list()
+            for seed in ("1", "2", "3"):
+                env = dict(os.environ, PYTHONHASHSEED=seed)
+                out = subprocess.check_output([sys.executable, "-c", code], env=env)
+                outputs.append(int(out.strip()))
+            self.assertEqual(outputs, [1, 0, 0])
+
+        def test_eviction(self):
+            for backend in BACKENDS:
+                cache = DiskCache(os.path.join(self.cache_dir, backend), backend,
+                                  max_entries=3)
+                for i in range(5):
+                    cache.set("k%s" % i, i)
+                    time.sleep(0.01)
+                self.assertEqual(len(cache), 3)
+                self.assertEqual(cache.get("k1"), (False, None))
+                self.assertEqual(cache.get("k2"), (True, 2))
+                cache.set("k5", 5) # k3 is the least recently used now
+                self.assertEqual(cache.get("k3"), (False, None))
+                self.assertEqual(cache.get("k2"), (True, 2))
+                if backend == "pickle":
+                    self.assertEqual(len([f for f in os.listdir(cache.cache_dir)
+                                          if f.endswith(".pk")]), 3)
+
+                size = len(obj2bytestr("x" * 100))
+                cache = DiskCache(os.path.join(self.cache_dir, backend + "bytes"), backend,
+                                  max_bytes=size * 2)
+                for i in range(3):
+                    cache.set(i, "x" * 100)
+                    time.sleep(0.01)
+                self.assertEqual(len(cache), 2)
+                self.assertEqual(cache.get(0), (False, None))
+
+        def test_ttl(self):
+            cache = DiskCache(self.cache_dir, ttl=0.05)
+            cache.set("a", 1)
+            cache.set("b", 2, ttl=100)
+            self.assertEqual(cache.get("a"), (True, 1))
+            time.sleep(0.1)
+            self.assertEqual(cache.get("a"), (False, None))
+            self.assertEqual(cache.get("b"), (True, 2))
+            
+            calls = list()
+            cache_dir = os.path.join(self.cache_dir, "ttl")
+            @memoize(cache_dir, ttl=0.2)
+            def double(x):
+                calls.append(x)
+                return 2 * x
+            double(1)
+            time.sleep(0.15)
+            # a new process loads it from disk into memory, with 0.05 sec left
+            @memoize(cache_dir, ttl=0.2)
+            def double(x):
+                calls.append(x)
+                return 2 * x
+            self.assertEqual(double(1), 2)
+            self.assertEqual(len(calls), 1)
+            time.sleep(0.1)
+            self.assertEqual(double(1), 2)
+            self.assertEqual(len(calls), 2)
+
+    unittest.main()
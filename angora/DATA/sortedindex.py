@@ -0,0 +1,276 @@
+##encoding=utf-8
+
+"""
+Copyright (c) 2015 by Sanhe Hu
+------------------------------
+    Author: Sanhe Hu
+    Email: husanhe@gmail.com
+    Lisence: LGPL
+
+
+Module description
+------------------
+    SortedIndex is a build-once, query-many version of angora.DATA.binarysearch.
+
+        1. numbers are stored in a compact array.array('d') / array.array('q') buffer, other
+           comparable items are stored in a list.
+        2. an optional block index (every block_size-th key, B-tree style) narrows down the
+           range before the final bisect, so a lookup mostly touches a small hot list.
+        3. lt, le, gt, ge, nearest, index returns a sentinel value instead of raising
+           ValueError, so hot loops don't pay for exceptions.
+        4. save() and SortedIndex.load() persist the index, no need to rebuild for every job.
+
+
+Keyword
+-------
+    algorithm, bineary search, index
+
+
+Compatibility
+-------------
+    Python2: Yes
+    Python3: Yes
+
+
+Prerequisites
+-------------
+    None
+
+
+Import Command
+--------------
+    from angora.DATA.sortedindex import SortedIndex
+"""
+
+from __future__ import print_function
+import bisect
+import pickle
+import array
+import sys
+
+is_py2 = (sys.version_info[0] == 2)
+if is_py2:
+    range = xrange
+    int_typecode = "l" # array.array in Python2 doesn't support "q"
+    integer_types = (int, long)
+else:
+    int_typecode = "q"
+    integer_types = (int,)
+
+def _make_store(items):
+    """choose the most compact storage for a sorted list of items
+    """
+    if all(isinstance(i, integer_types) and not isinstance(i, bool) for i in items):
+        try:
+            return array.array(int_typecode, items)
+        except OverflowError:
+            return items
+    if all(isinstance(i, (float,) + integer_types) and not isinstance(i, bool) for i in items):
+        return array.array("d", items)
+    return items
+
+class SortedIndex(object):
+    """A static sorted array optimized for repeated lookups.
+
+    [Args]
+    ------
+        array: iterable of comparable items. It will be sorted if it's not.
+
+        missing: the sentinel value returned when a lookup has no answer, default None
+
+        block_size: size of a block in the block index, None to disable block index.
+            Default 64.
+
+    Example::
+
+        >>> index = SortedIndex([1, 3, 5, 7])
+        >>> index.le(4)
+        3
+        >>> index.gt(7) is None
+        True
+        >>> index.count_between(2, 6)
+        2
+    """
+    def __init__(self, array, missing=None, block_size=64):
+        self.missing = missing
+        self.block_size = block_size
+        self.store = _make_store(sorted(array))
+        self._build_block_index()
+
+    def _build_block_index(self):
+        if self.block_size:
+            self._fences = list(self.store[::self.block_size])
+        else:
+            self._fences = None
+
+    def __len__(self):
+        return len(self.store)
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __getitem__(self, index):
+        return self.store[index]
+
+    def __contains__(self, x):
+        return self.index(x) != -1
+
+    def __repr__(self):
+        return "%s(%s items)" % (self.__class__.__name__, len(self.store))
+
+    def _bisect_left(self, x):
+        if self._fences is None:
+            return bisect.bisect_left(self.store, x)
+        block = bisect.bisect_left(self._fences, x)
+        lo = max(block - 1, 0) * self.block_size
+        hi = min(block * self.block_size, len(self.store))
+        return bisect.bisect_left(self.store, x, lo, hi)
+
+    def _bisect_right(self, x):
+        if self._fences is None:
+            return bisect.bisect_right(self.store, x)
+        block = bisect.bisect_right(self._fences, x)
+        lo = max(block - 1, 0) * self.block_size
+        hi = min(block * self.block_size, len(self.store))
+        return bisect.bisect_right(self.store, x, lo, hi)
+
+    def index(self, x):
+        "Locate the leftmost index of value exactly equal to x, -1 if not found"
+        i = self._bisect_left(x)
+        if i != len(self.store) and self.store[i] == x:
+            return i
+        return -1
+
+    def lt(self, x):
+        "Find rightmost value less than x"
+        i = self._bisect_left(x)
+        if i:
+            return self.store[i-1]
+        return self.missing
+
+    def le(self, x):
+        "Find rightmost value less than or equal to x"
+        i = self._bisect_right(x)
+        if i:
+            return self.store[i-1]
+        return self.missing
+
+    def gt(self, x):
+        "Find leftmost value greater than x"
+        i = self._bisect_right(x)
+        if i != len(self.store):
+            return self.store[i]
+        return self.missing
+
+    def ge(self, x):
+        "Find leftmost value greater than or equal to x"
+        i = self._bisect_left(x)
+        if i != len(self.store):
+            return self.store[i]
+        return self.missing
+
+    def nearest(self, x):
+        "Find the nearest value of x, ties go to the lower value"
+        n = len(self.store)
+        if not n:
+            return self.missing
+        i = self._bisect_left(x)
+        if i == 0:
+            return self.store[0]
+        if i == n:
+            return self.store[-1]
+        upper = self.store[i]
+        if upper == x:
+            return upper
+        lower = self.store[i-1]
+        if (x - lower) > (upper - x):
+            return upper
+        return lower
+
+    def count_between(self, lo, hi, inclusive=True):
+        """number of values between lo and hi. inclusive=True means lo <= value <= hi,
+        otherwise lo < value < hi.
+        """
+        if inclusive:
+            count = self._bisect_right(hi) - self._bisect_left(lo)
+        else:
+            count = self._bisect_left(hi) - self._bisect_right(lo)
+        return max(count, 0)
+
+    def __getstate__(self):
+        return {"missing": self.missing, "block_size": self.block_size, "store": self.store}
+
+    def __setstate__(self, state):
+        self.missing = state["missing"]
+        self.block_size = state["block_size"]
+        self.store = state["store"]
+        self._build_block_index()
+
+    def save(self, fname, pickle_protocol=2):
+        """dump the index to a pickle file. The block index is rebuilt on load
+        """
+        with open(fname, "wb") as f:
+            pickle.dump(self, f, protocol=pickle_protocol)
+
+    @staticmethod
+    def load(fname):
+        """load index from file dumped by SortedIndex.save()
+        """
+        with open(fname, "rb") as f:
+            return pickle.load(f)
+
+if __name__ == "__main__":
+    import unittest
+    import random
+    import os
+    from binarysearch import find_lt, find_le, find_gt, find_ge, find_nearest
+
+    class SortedIndexUnittest(unittest.TestCase):
+        def setUp(self):
+            self.sorted_array = sorted(random.randint(0, 5000) for _ in range(1000))
+
+        def test_store(self):
+            self.assertEqual(SortedIndex([3, 1, 2]).store.typecode, int_typecode)
+            self.assertEqual(SortedIndex([3, 1.5, 2]).store.typecode, "d")
+            self.assertTrue(isinstance(SortedIndex(["b", "a"]).store, list))
+
+        def test_same_as_binarysearch(self):
+            for block_size in [None, 1, 7, 64]:
+                index = SortedIndex(self.sorted_array, block_size=block_size)
+                for x in range(-10, 5010, 3):
+                    for method, func in [(index.lt, find_lt), (index.le, find_le),
+                                         (index.gt, find_gt), (index.ge, find_ge)]:
+                        try:
+                            expect = func(self.sorted_array, x)
+                        except ValueError:
+                            expect = None
+                        self.assertEqual(method(x), expect)
+                    self.assertEqual(index.nearest(x), find_nearest(self.sorted_array, x))
+                    self.assertEqual(index.nearest(x + 0.5),
+                                     find_nearest(self.sorted_array, x + 0.5))
+
+        def test_index_and_count(self):
+            index = SortedIndex([1, 3, 3, 3, 5, 7], missing=-1, block_size=2)
+            self.assertEqual(index.index(3), 1)
+            self.assertEqual(index.index(4), -1)
+            self.assertFalse(4 in index)
+            self.assertEqual(index.lt(1), -1)
+            self.assertEqual(index.count_between(3, 5), 4)
+            self.assertEqual(index.count_between(3, 5, inclusive=False), 0)
+            self.assertEqual(index.count_between(0, 100), 6)
+            self.assertEqual(index.count_between(6, 4), 0)
+
+        def test_save_and_load(self):
+            index = SortedIndex(self.sorted_array, block_size=16)
+            index.save("sortedindex.p")
+            index = SortedIndex.load("sortedindex.p")
+            self.assertListEqual(list(index), self.sorted_array)
+            self.assertEqual(len(index._fences), len(self.sorted_array[::16]))
+
+        def tearDown(self):
+            try:
+                os.remove("sortedindex.p")
+            except:
+                pass
+
+    unittest.main()
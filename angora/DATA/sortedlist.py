@@ -0,0 +1,353 @@
+##encoding=utf-8
+
+"""
+Copyright (c) 2015 by Sanhe Hu
+------------------------------
+    Author: Sanhe Hu
+    Email: husanhe@gmail.com
+    Lisence: LGPL
+
+
+Module description
+------------------
+    SortedList is a mutable sorted container for streaming inserts. Keeping a plain list
+    sorted with bisect.insort costs O(n) per insert. SortedList keeps items in many small
+    sorted buckets (about load ~ 2 * load items each), plus a list of bucket maxes. So add and
+    remove only bisect the maxes and shift one small bucket, roughly O(log n).
+
+    It has the same find_lt, find_le, find_gt, find_ge, find_nearest, find_index methods
+    as angora.DATA.binarysearch, and irange() to iterate items between two keys without
+    copying.
+
+
+Keyword
+-------
+    algorithm, bineary search, sorted list
+
+
+Compatibility
+-------------
+    Python2: Yes
+    Python3: Yes
+
+
+Prerequisites
+-------------
+    None
+
+
+Import Command
+--------------
+    from angora.DATA.sortedlist import SortedList
+"""
+
+from __future__ import print_function
+import itertools
+import bisect
+import sys
+
+is_py2 = (sys.version_info[0] == 2)
+if is_py2:
+    range = xrange
+
+class SortedList(object):
+    """A sorted list built on chunked buckets.
+
+    [Args]
+    ------
+        iterable: initial items, default None
+
+        load: the load factor. Bucket is split when it grows over 2 * load items, and
+            merged with its neighbour when it shrinks below load / 2. Default 1000.
+    """
+    def __init__(self, iterable=None, load=1000):
+        self.load = load
+        self.clear()
+        if iterable is not None:
+            self.update(iterable)
+
+    def clear(self):
+        self._lists = list() # list of sorted buckets
+        self._maxes = list() # max value of each bucket
+        self._offsets = None # global index of first item in each bucket, lazily built
+        self._len = 0
+
+    def update(self, iterable):
+        """add all items from iterable
+        """
+        items = sorted(itertools.chain(self, iterable))
+        self._lists = [items[i:i+self.load] for i in range(0, len(items), self.load)]
+        self._maxes = [bucket[-1] for bucket in self._lists]
+        self._offsets = None
+        self._len = len(items)
+
+    def add(self, x):
+        """insert x, keep the list sorted
+        """
+        if not self._maxes:
+            self._lists.append([x])
+            self._maxes.append(x)
+        else:
+            b = bisect.bisect_right(self._maxes, x)
+            if b == len(self._maxes):
+                b -= 1
+                self._lists[b].append(x)
+                self._maxes[b] = x
+            else:
+                bisect.insort(self._lists[b], x)
+            if len(self._lists[b]) > 2 * self.load:
+                bucket = self._lists[b]
+                self._lists[b:b+1] = [bucket[:self.load], bucket[self.load:]]
+                self._maxes[b:b+1] = [bucket[self.load-1], bucket[-1]]
+        self._offsets = None
+        self._len += 1
+
+    def remove(self, x):
+        """remove one item equal to x, raise ValueError if not found
+        """
+        b = bisect.bisect_left(self._maxes, x)
+        if b == len(self._maxes):
+            raise ValueError("%r not in list" % (x,))
+        bucket = self._lists[b]
+        p = bisect.bisect_left(bucket, x)
+        if bucket[p] != x:
+            raise ValueError("%r not in list" % (x,))
+        del bucket[p]
+        self._len -= 1
+        self._offsets = None
+
+        if not bucket:
+            del self._lists[b]
+            del self._maxes[b]
+        else:
+            self._maxes[b] = bucket[-1]
+            if (len(bucket) < self.load // 2) and (len(self._lists) > 1):
+                if b == len(self._lists) - 1:
+                    b -= 1
+                merged = self._lists[b] + self._lists[b+1]
+                if len(merged) > 2 * self.load:
+                    half = len(merged) // 2
+                    self._lists[b:b+2] = [merged[:half], merged[half:]]
+                    self._maxes[b:b+2] = [merged[half-1], merged[-1]]
+                else:
+                    self._lists[b:b+2] = [merged]
+                    self._maxes[b:b+2] = [merged[-1]]
+
+    def discard(self, x):
+        """remove one item equal to x if exists
+        """
+        try:
+            self.remove(x)
+        except ValueError:
+            pass
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._lists)
+
+    def __reversed__(self):
+        return itertools.chain.from_iterable(reversed(bucket) for bucket in reversed(self._lists))
+
+    def __contains__(self, x):
+        b, p = self._loc_left(x)
+        return (b < len(self._lists)) and (p < len(self._lists[b])) and self._lists[b][p] == x
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._len
+        if not (0 <= index < self._len):
+            raise IndexError("list index out of range")
+        offsets = self._get_offsets()
+        b = bisect.bisect_right(offsets, index) - 1
+        return self._lists[b][index - offsets[b]]
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self))
+
+    def _get_offsets(self):
+        if self._offsets is None:
+            self._offsets = list()
+            total = 0
+            for bucket in self._lists:
+                self._offsets.append(total)
+                total += len(bucket)
+        return self._offsets
+
+    #--- locate ---
+    # (b, p) is a position, b is the bucket index, p is the index in bucket. Past the end
+    # is (last bucket, len(last bucket)).
+    def _end(self):
+        if not self._lists:
+            return 0, 0
+        return len(self._lists) - 1, len(self._lists[-1])
+
+    def _loc_left(self, x):
+        """position of bisect_left(x)"""
+        b = bisect.bisect_left(self._maxes, x)
+        if b == len(self._maxes):
+            return self._end()
+        return b, bisect.bisect_left(self._lists[b], x)
+
+    def _loc_right(self, x):
+        """position of bisect_right(x)"""
+        b = bisect.bisect_right(self._maxes, x)
+        if b == len(self._maxes):
+            return self._end()
+        return b, bisect.bisect_right(self._lists[b], x)
+
+    def _before(self, b, p):
+        """item right before the position"""
+        if p:
+            return self._lists[b][p-1]
+        if b:
+            return self._lists[b-1][-1]
+        raise ValueError
+
+    def _at(self, b, p):
+        """item at the position"""
+        if self._lists and p < len(self._lists[b]):
+            return self._lists[b][p]
+        raise ValueError
+
+    #--- same as angora.DATA.binarysearch ---
+    def find_index(self, x):
+        "Locate the leftmost index of value exactly equal to x"
+        b, p = self._loc_left(x)
+        if self._at(b, p) == x: # _at raise ValueError if past the end
+            return self._get_offsets()[b] + p
+        raise ValueError
+
+    def find_lt(self, x):
+        "Find rightmost value less than x"
+        return self._before(*self._loc_left(x))
+
+    def find_le(self, x):
+        "Find rightmost value less than or equal to x"
+        return self._before(*self._loc_right(x))
+
+    def find_gt(self, x):
+        "Find leftmost value greater than x"
+        return self._at(*self._loc_right(x))
+
+    def find_ge(self, x):
+        "Find leftmost item greater than or equal to x"
+        return self._at(*self._loc_left(x))
+
+    def find_nearest(self, x):
+        """find the nearest item of x
+        """
+        if not self._len:
+            raise ValueError
+        first, last = self._lists[0][0], self._maxes[-1]
+        if x <= first:
+            return first
+        elif x >= last:
+            return last
+        else:
+            lower = self.find_le(x)
+            upper = self.find_ge(x)
+            if (x - lower) > (upper - x):
+                return upper
+            else:
+                return lower
+
+    def irange(self, lo=None, hi=None, inclusive=(True, True), reverse=False):
+        """iterate items between lo and hi without copying. None means no bound.
+
+        [Args]
+        ------
+            lo, hi: lower and upper bound
+
+            inclusive: (boolean, boolean), whether lo and hi are included
+
+            reverse: boolean, default False. If True, iterate from hi to lo
+        """
+        if not self._lists:
+            return iter(())
+        if lo is None:
+            start = (0, 0)
+        elif inclusive[0]:
+            start = self._loc_left(lo)
+        else:
+            start = self._loc_right(lo)
+        if hi is None:
+            stop = self._end()
+        elif inclusive[1]:
+            stop = self._loc_right(hi)
+        else:
+            stop = self._loc_left(hi)
+        if stop < start:
+            return iter(())
+
+        (b0, p0), (b1, p1) = start, stop
+        lists = self._lists
+        if not reverse:
+            return itertools.chain.from_iterable(
+                itertools.islice(lists[b], p0 if b == b0 else 0, p1 if b == b1 else None)
+                for b in range(b0, b1 + 1))
+        else:
+            def reversed_bucket(b):
+                bucket = lists[b]
+                start = p0 if b == b0 else 0
+                stop = p1 if b == b1 else len(bucket)
+                for i in range(stop - 1, start - 1, -1):
+                    yield bucket[i]
+            return itertools.chain.from_iterable(
+                reversed_bucket(b) for b in range(b1, b0 - 1, -1))
+
+if __name__ == "__main__":
+    import unittest
+    import random
+    from binarysearch import find_index, find_lt, find_le, find_gt, find_ge, find_nearest
+
+    class SortedListUnittest(unittest.TestCase):
+        def test_add_and_remove(self):
+            sl, expect = SortedList(load=4), list()
+            for _ in range(2000):
+                x = random.randint(0, 300)
+                if expect and random.random() < 0.4:
+                    x = random.choice(expect)
+                    sl.remove(x)
+                    expect.remove(x)
+                else:
+                    sl.add(x)
+                    bisect.insort(expect, x)
+                self.assertEqual(len(sl), len(expect))
+            self.assertListEqual(list(sl), expect)
+            self.assertListEqual(list(reversed(sl)), expect[::-1])
+            self.assertListEqual([sl[i] for i in range(len(sl))], expect)
+            self.assertRaises(ValueError, sl.remove, 1000)
+            for bucket in sl._lists:
+                self.assertTrue(0 < len(bucket) <= 8)
+
+        def test_same_as_binarysearch(self):
+            expect = sorted(random.randint(0, 1000) for _ in range(500))
+            sl = SortedList(load=8)
+            for x in expect[::-1]:
+                sl.add(x)
+            for x in range(-5, 1005):
+                for method, func in [(sl.find_index, find_index), (sl.find_lt, find_lt),
+                                     (sl.find_le, find_le), (sl.find_gt, find_gt),
+                                     (sl.find_ge, find_ge), (sl.find_nearest, find_nearest)]:
+                    try:
+                        value = func(expect, x)
+                    except ValueError:
+                        self.assertRaises(ValueError, method, x)
+                    else:
+                        self.assertEqual(method(x), value)
+                self.assertEqual(x in sl, x in expect)
+
+        def test_irange(self):
+            sl = SortedList([5, 1, 3, 3, 9, 7, 2, 8], load=2)
+            self.assertListEqual(list(sl.irange(3, 8)), [3, 3, 5, 7, 8])
+            self.assertListEqual(list(sl.irange(3, 8, inclusive=(False, False))), [5, 7])
+            self.assertListEqual(list(sl.irange(3, 8, reverse=True)), [8, 7, 5, 3, 3])
+            self.assertListEqual(list(sl.irange(hi=2)), [1, 2])
+            self.assertListEqual(list(sl.irange(lo=8)), [8, 9])
+            self.assertListEqual(list(sl.irange(4, 4)), [])
+            self.assertListEqual(list(sl.irange(10, 0)), [])
+            self.assertListEqual(list(SortedList().irange(0, 1)), [])
+
+    unittest.main()
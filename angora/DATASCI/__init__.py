@@ -1,4 +1,10 @@
 ##encoding=utf-8
 
-from .interpolate import LinearInterpolator, arange
-from .outlier import find_outlier, clear_outlier_onetime, clear_outlier_literally
\ No newline at end of file
+from .interpolate import (LinearInterpolator, PreviousInterpolator, NextInterpolator,
+    NearestInterpolator, CubicSplineInterpolator, FloatRange, arange)
+from .outlier import (find_outlier, clear_outlier_onetime, clear_outlier_literally,
+    RunningStats, find_outlier_stream, OnlineOutlierDetector, rolling_outlier, rolling_outlier_mad,
+    fast_mean_stdev,
+    quickselect, quantile, median_mad,
+    find_outlier_mad, clear_outlier_mad, find_outlier_iqr, clear_outlier_iqr,
+    find_outlier_grouped)
\ No newline at end of file
@@ -0,0 +1,239 @@
+##encoding=utf-8
+
+"""
+Copyright (c) 2015 by Sanhe Hu
+------------------------------
+    Author: Sanhe Hu
+    Email: husanhe@gmail.com
+    Lisence: LGPL
+
+
+Module description
+------------------
+    Benchmark suite for angora.DATASCI, with regression tracking.
+
+        1. every case is timed over several input sizes, with warmup and repeats, and
+           reported as min / median seconds.
+        2. results can be dumped to a json file, and compared against a saved baseline.
+           A case slower than baseline * (1 + tolerance) is a regression.
+
+    Usage::
+
+        # save a baseline
+        python -m angora.DATASCI.benchmark --output baseline.json
+
+        # later, compare to baseline, exit code is 1 if there's any regression
+        python -m angora.DATASCI.benchmark --output result.json --baseline baseline.json
+
+
+Compatibility
+-------------
+    IronPython2.7: Yes
+
+Prerequisites
+-------------
+    None
+
+Import Command
+--------------
+    from angora.DATASCI.benchmark import run_benchmark, dump_result, load_result, compare
+"""
+
+from __future__ import print_function
+import itertools
+import argparse
+import random
+import timeit
+import json
+import sys
+
+from .interpolate import (LinearInterpolator, PreviousInterpolator, NextInterpolator,
+    NearestInterpolator, CubicSplineInterpolator, arange)
+from .outlier import find_outlier, clear_outlier_onetime, clear_outlier_literally
+
+is_py2 = (sys.version_info[0] == 2)
+if is_py2:
+    range = xrange
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+def measure(func, warmup=1, repeat=5):
+    """time func() repeat times after warmup runs, returns {"min": ..., "median": ...}
+    """
+    for _ in range(warmup):
+        func()
+    timings = list()
+    for _ in range(repeat):
+        st = timeit.default_timer()
+        func()
+        timings.append(timeit.default_timer() - st)
+    timings.sort()
+    half = len(timings) // 2
+    if len(timings) % 2:
+        median = timings[half]
+    else:
+        median = (timings[half-1] + timings[half]) / 2.0
+    return {"min": timings[0], "median": median, "repeat": repeat}
+
+#########
+# Cases #
+#########
+# every case is a function take input size, returns the function to be timed
+
+def _interpolate_data(size):
+    x = [i * 1.0 for i in range(size)]
+    y = [(i % 97) * 0.5 for i in range(size)]
+    x_new = [i * 0.8731 for i in range(int((size - 1) / 0.8731))]
+    return x, y, x_new
+
+def _interpolator_build_case(kind):
+    """case of kind(x, y), building an interpolator of the given kind"""
+    def case(size):
+        x, y, _ = _interpolate_data(size)
+        return lambda: kind(x, y, engine="python")
+    return case
+
+def _interpolator_call_case(kind):
+    """case of evaluating an interpolator of the given kind"""
+    def case(size):
+        x, y, x_new = _interpolate_data(size)
+        f = kind(x, y, engine="python")
+        return lambda: f(x_new)
+    return case
+
+def case_interpolate_legacy(size):
+    x, y, x_new = _interpolate_data(size)
+    f = LinearInterpolator(x, y, engine="python")
+    return lambda: f.interpolate_legacy(x_new)
+
+def case_arange(size):
+    return lambda: arange(start=0, end=size, gap=0.5).to_array()
+
+def _outlier_data(size):
+    rnd = random.Random(size)
+    return [rnd.gauss(0, 1) for _ in range(size)]
+
+def case_find_outlier(size):
+    array = _outlier_data(size)
+    return lambda: find_outlier(array)
+
+def case_find_outlier_exact(size):
+    array = _outlier_data(size)
+    return lambda: find_outlier(array, exact=True)
+
+def case_clear_outlier_onetime(size):
+    array = _outlier_data(size)
+    return lambda: clear_outlier_onetime(array)
+
+def case_clear_outlier_literally(size):
+    array = _outlier_data(size)
+    return lambda: clear_outlier_literally(array)
+
+CASES = [
+    ("LinearInterpolator.__call__", _interpolator_call_case(LinearInterpolator)),
+    ("LinearInterpolator.interpolate_legacy", case_interpolate_legacy),
+    ("LinearInterpolator.__init__", _interpolator_build_case(LinearInterpolator)),
+    ("PreviousInterpolator.__init__", _interpolator_build_case(PreviousInterpolator)),
+    ("PreviousInterpolator.__call__", _interpolator_call_case(PreviousInterpolator)),
+    ("NextInterpolator.__init__", _interpolator_build_case(NextInterpolator)),
+    ("NextInterpolator.__call__", _interpolator_call_case(NextInterpolator)),
+    ("NearestInterpolator.__init__", _interpolator_build_case(NearestInterpolator)),
+    ("NearestInterpolator.__call__", _interpolator_call_case(NearestInterpolator)),
+    ("CubicSplineInterpolator.__init__", _interpolator_build_case(CubicSplineInterpolator)),
+    ("CubicSplineInterpolator.__call__", _interpolator_call_case(CubicSplineInterpolator)),
+    ("arange", case_arange),
+    ("find_outlier", case_find_outlier),
+    ("find_outlier(exact=True)", case_find_outlier_exact),
+    ("clear_outlier_onetime", case_clear_outlier_onetime),
+    ("clear_outlier_literally", case_clear_outlier_literally),
+]
+
+def run_benchmark(sizes=DEFAULT_SIZES, warmup=1, repeat=5, cases=None, enable_verbose=True):
+    """run benchmark cases over sizes
+
+    [Args]
+    ------
+        sizes: list of input size
+
+        warmup, repeat: see measure()
+
+        cases: list of case name to run, default all
+
+        enable_verbose: boolean, default True. Trigger for printing report
+
+    [Returns]
+    ---------
+        result: dict, "case name|size" -> {"min": ..., "median": ..., "repeat": ...}
+    """
+    result = dict()
+    for (name, case), size in itertools.product(CASES, sizes):
+        if (cases is not None) and (name not in cases):
+            continue
+        key = "%s|%s" % (name, size)
+        result[key] = measure(case(size), warmup=warmup, repeat=repeat)
+        if enable_verbose:
+            print("%-50s min %.6f sec, median %.6f sec" % (
+                key, result[key]["min"], result[key]["median"]))
+    return result
+
+def dump_result(result, fname):
+    """dump benchmark result to json file
+    """
+    with open(fname, "w") as f:
+        json.dump(result, f, sort_keys=True, indent=4, separators=(",", ": "))
+
+def load_result(fname):
+    """load benchmark result from json file
+    """
+    with open(fname, "r") as f:
+        return json.load(f)
+
+def compare(result, baseline, tolerance=0.2, metric="min"):
+    """compare result to baseline
+
+    [Args]
+    ------
+        result, baseline: benchmark result dict
+
+        tolerance: allowed slow down ratio, default 0.2 means 20% slower is still fine
+
+        metric: "min" or "median"
+
+    [Returns]
+    ---------
+        regressions: list of (key, baseline seconds, current seconds, ratio), sorted by key.
+            Empty list means no regression. Cases not in both are ignored.
+    """
+    regressions = list()
+    for key in sorted(set(result) & set(baseline)):
+        before, after = baseline[key][metric], result[key][metric]
+        ratio = after / before if before else float("inf")
+        if ratio > 1 + tolerance:
+            regressions.append((key, before, after, ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark angora.DATASCI")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cases", nargs="+", default=None, help="case names, default all")
+    parser.add_argument("--output", help="dump result to this json file")
+    parser.add_argument("--baseline", help="compare result to this json file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args.sizes, args.warmup, args.repeat, args.cases)
+    if args.output:
+        dump_result(result, args.output)
+    if args.baseline:
+        regressions = compare(result, load_result(args.baseline), args.tolerance)
+        for key, before, after, ratio in regressions:
+            print("REGRESSION %s: %.6f sec -> %.6f sec (x%.2f)" % (key, before, after, ratio))
+        if regressions:
+            return 1
+        print("No regression.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,14 +13,30 @@ Compatibility
 
 Prerequisites
 -------------
-    None
+    None. numpy is optional, if installed interpolators use the vectorized engine.
 
 Import Command
 --------------
-    from angora.DATASCI.interpolate import LinearInterpolator, arange
+    from angora.DATASCI.interpolate import (LinearInterpolator, PreviousInterpolator,
+        NextInterpolator, NearestInterpolator, CubicSplineInterpolator, FloatRange, arange)
 """
 
+from __future__ import division
+import itertools
 import bisect
+import array
+import abc
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+is_py2 = (sys.version_info[0] == 2)
+if is_py2:
+    range = xrange
+    zip = itertools.izip
 
 def find_lt(array, x):
     "Find rightmost item index less than x"
@@ -42,49 +58,282 @@ def find_ge(array, x):
     i = bisect.bisect_left(array, x)
     return i
 
-class LinearInterpolator():
-    def __init__(self, x, y):
+def _same_type(x_new, y_new):
+    """convert list y_new to the container type of x_new
+    """
+    if isinstance(x_new, array.array):
+        return array.array("d", y_new)
+    if (np is not None) and isinstance(x_new, np.ndarray):
+        return np.asarray(y_new, dtype=float)
+    if (np is not None) and isinstance(y_new, np.ndarray):
+        return y_new.tolist()
+    return y_new
+
+def _is_sequence(obj):
+    return hasattr(obj, "__len__") and not isinstance(obj, (str, bytes))
+
+def _split_columns(y):
+    """split y into (names, columns). names is None for single series, list of keys for
+    dict, and list of column index for 2-D y.
+    """
+    if isinstance(y, dict):
+        names = list(y)
+        return names, [y[name] for name in names]
+    if len(y) and _is_sequence(y[0]):
+        return list(range(len(y))), list(y)
+    return None, [y]
+
+_extrapolate_policies = ("raise", "clamp", "linear", "nan")
+
+# class statement syntax of metaclass differs in Python2 and 3
+_ABCBase = abc.ABCMeta("_ABCBase", (object,), {"__slots__": ()})
+
+class BaseInterpolator(_ABCBase):
+    """Base class of all interpolators. It owns the machinery shared by every kind:
+    the merge-walk python engine, the searchsorted numpy engine, unsorted x_new, multi 
+    series, extrapolate policies and the cursor API. A subclass only has to build its
+    coefficient tables and tell how to evaluate one point in segment k.
+    
+    [Args]
+    ------
+        x: list, array.array or numpy.ndarray, has to be sorted
+        
+        y: 1-D sequence for single series. Or multi series sharing the same x, either a
+            list of columns, or a dict of name -> column. Segments are located only once
+            per x_new, then all series are evaluated in that pass.
+        
+        engine: "python" or "numpy". Default None means numpy if installed, otherwise
+            python. Both engines return identical results.
+        
+        extrapolate: what to do with x_new out of [x[0], x[-1]]. Default "raise".
+            "raise": raise ValueError
+            "clamp": use y of the nearest end
+            "linear": extend linearly from the end (same as "clamp" for step kinds)
+            "nan": float("nan")
+    
+    For multi series, the result is a list of columns, or a dict of name -> column.
+    """
+    __slots__ = ("x", "y", "lower", "upper", "engine", "extrapolate", "names", "columns", 
+                 "_np_x", "_np_y")
+    
+    def __init__(self, x, y, engine=None, extrapolate="raise"):
         self.x = x
         self.y = y
         self.lower = x[0]
         self.upper = x[-1]
+        self.names, self.columns = _split_columns(y)
+        
+        if engine is None:
+            engine = "python" if np is None else "numpy"
+        if engine not in ("python", "numpy"):
+            raise ValueError("engine has to be 'python' or 'numpy'")
+        if (engine == "numpy") and (np is None):
+            raise ImportError("numpy is not installed")
+        self.engine = engine
+        if extrapolate not in _extrapolate_policies:
+            raise ValueError("extrapolate has to be one of %s" % (_extrapolate_policies,))
+        self.extrapolate = extrapolate
+        self._build_python()
+        if engine == "numpy":
+            self._build_numpy()
+
+    def _build_python(self):
+        """precompute coefficient tables for python engine, O(n)
+        """
+        
+    def _build_numpy(self):
+        """precompute coefficient tables for numpy engine
+        """
+        self._np_x = np.asarray(self.x, dtype=float)
+        self._np_y = np.asarray(self.columns, dtype=float) # 2-D, one row per series
+
+    @abc.abstractmethod
+    def _values(self, k, i):
+        """list of y of all series for x = i in segment k. x[k] <= i, and i < x[k+1] 
+        if k is not the last index.
+        """
+
+    def _extend_values(self, i):
+        """list of y of all series for out of range i, extrapolate = "linear"
+        """
+        k = 0 if i < self.lower else len(self.x) - 1
+        return [column[k] for column in self.columns]
+
+    @abc.abstractmethod
+    def _numpy_evaluate(self, ind, x3):
+        """numpy version of _values. ind = searchsorted(x, x3, side="right") - 1.
+        Returns 2-D array, one row per series.
+        """
+
+    def _numpy_extend(self, x3, below, above, y_new):
+        """numpy version of _extend_values
+        """
+        y_new = np.where(below, self._np_y[:, :1], y_new)
+        return np.where(above, self._np_y[:, -1:], y_new)
 
+    def _evaluate(self, k, i):
+        values = self._values(k, i)
+        if self.names is None:
+            return values[0]
+        return tuple(values)
+
+    def _wrap(self, x_new, columns):
+        """wrap list of result columns the same way as y, every column has the same
+        container type as x_new
+        """
+        columns = [_same_type(x_new, column) for column in columns]
+        if self.names is None:
+            return columns[0]
+        elif isinstance(self.y, dict):
+            return dict(zip(self.names, columns))
+        else:
+            return columns
+        
+    def _wrap_rows(self, x_new, rows):
+        """wrap the rows yield by InterpolatorCursor.iterate()
+        """
+        if self.names is None:
+            return self._wrap(x_new, [rows])
+        if rows:
+            return self._wrap(x_new, [list(column) for column in zip(*rows)])
+        return self._wrap(x_new, [list() for _ in self.names])
+
+    def _extrapolate(self, i):
+        """y (tuple of y for multi series) for a out of range x, by extrapolate policy.
+        """
+        policy = self.extrapolate
+        if policy == "raise":
+            raise ValueError("%r is out of range [%r, %r]" % (i, self.lower, self.upper))
+        
+        if policy == "nan":
+            values = [float("nan")] * len(self.columns)
+        elif (policy == "clamp") or (len(self.x) == 1):
+            k = 0 if i < self.lower else len(self.x) - 1
+            values = [column[k] for column in self.columns]
+        else:
+            values = self._extend_values(i)
+        
+        if self.names is None:
+            return values[0]
+        return tuple(values)
+        
     def __call__(self, x_new):
-        """Interpolate value to new x axis. O(n) implementation
+        """Interpolate value to new x axis. Returns the same container type as x_new
+        (list, array.array or numpy.ndarray). Sorted x_new is faster, unsorted x_new is 
+        sorted once then the results are put back to the original order.
         """
-        if ((x_new[0] < self.lower) or (x_new[-1] > self.upper)):
-            raise ValueError
+        if self.engine == "numpy":
+            return self._wrap(x_new, self._call_numpy(x_new))
+        else:
+            return self._wrap_rows(x_new, self._call_python(x_new))
+    
+    def _call_numpy(self, x_new):
+        """vectorized engine, locate all x_new with searchsorted then evaluate in bulk.
+        Returns 2-D array, one row per series.
+        """
+        x3 = np.asarray(x_new, dtype=float)
+        below, above = (x3 < self.lower), (x3 > self.upper)
+        out_of_range = below | above
+        if self.extrapolate == "raise" and out_of_range.any():
+            raise ValueError("x_new is out of range [%r, %r]" % (self.lower, self.upper))
         
-        ind1 = find_le(self.x, x_new[0])
-        x = self.x[ind1:][::-1]
-        y = self.y[ind1:][::-1]
+        n = len(self._np_x)
+        if n == 1:
+            return np.where(out_of_range & (self.extrapolate == "nan"), np.nan,
+                            np.repeat(self._np_y[:, :1], len(x3), axis=1))
         
-        y_new = list()
-        for i in x_new:
-            while 1:
-                try:
-                    x1, y1 = x.pop(), y.pop()
-                    if x1 <= i:
-                        left_x = x1
-                        left_y = y1
-                    else:
-                        right_x = x1
-                        right_y = y1
-                        x.append(right_x)
-                        x.append(left_x)
-                        y.append(right_y)
-                        y.append(left_y)
-                        y_new.append(self.locate(left_x, left_y, right_x, right_y, i))
-                        break
-                except:
-                    y_new.append(left_y)
-                    break
+        ind = np.searchsorted(self._np_x, x3, side="right") - 1 # works for unsorted
+        y_new = self._numpy_evaluate(ind, x3)
+        if self.extrapolate == "clamp":
+            y_new = BaseInterpolator._numpy_extend(self, x3, below, above, y_new)
+        elif self.extrapolate == "linear":
+            y_new = self._numpy_extend(x3, below, above, y_new)
+        elif self.extrapolate == "nan":
+            y_new = np.where(out_of_range, np.nan, y_new)
         return y_new
+    
+    def _call_python(self, x_new):
+        """pure python engine, O(n) implementation. A merge-walk on index, source 
+        arrays are not copied. Unsorted x_new is argsorted once, walked, then results
+        are scattered back.
+        """
+        for a, b in zip(x_new, itertools.islice(x_new, 1, None)):
+            if a > b:
+                break
+        else:
+            return list(self.cursor().iterate(x_new))
+        
+        order = sorted(range(len(x_new)), key=x_new.__getitem__)
+        rows = [None] * len(x_new)
+        for ind, row in zip(order, self.cursor().iterate(x_new[ind] for ind in order)):
+            rows[ind] = row
+        return rows
+    
+    def cursor(self):
+        """return a InterpolatorCursor, for streaming / chunked evaluation
+        """
+        return InterpolatorCursor(self)
+    
+    def stream(self, x_iter):
+        """lazily yield interpolated y for a sorted iterable of x, in constant memory
+        """
+        return self.cursor().iterate(x_iter)
+
+class LinearInterpolator(BaseInterpolator):
+    """Linear interpolator. See BaseInterpolator for arguments.
+    """
+    __slots__ = ("_dx", "_dys", "_np_dx", "_np_dy")
+    
+    def _build_python(self):
+        """precompute the (x1 - x2) and (y1 - y2) of every segment, in array("d") buffer
+        """
+        x = self.x
+        indices = range(len(x) - 1)
+        self._dx = array.array("d", [x[k] - x[k+1] for k in indices])
+        self._dys = [array.array("d", [column[k] - column[k+1] for k in indices])
+                     for column in self.columns]
+        
+    def _build_numpy(self):
+        """precompute x, y arrays and the (y1 - y2), (x1 - x2) of every segment
+        """
+        BaseInterpolator._build_numpy(self)
+        self._np_dy = self._np_y[:, :-1] - self._np_y[:, 1:]
+        self._np_dx = self._np_x[:-1] - self._np_x[1:]
+
+    # y1 - dy * (x1 - x3) / dx is exactly the formula of LinearInterpolator.locate()
+    def _values(self, k, i):
+        if k == len(self.x) - 1:
+            return [column[k] for column in self.columns]
+        d, dxk = self.x[k] - i, self._dx[k]
+        return [column[k] - dy[k] * d / dxk for column, dy in zip(self.columns, self._dys)]
+    
+    def _extend_values(self, i):
+        k = 0 if i < self.lower else len(self.x) - 2
+        d, dxk = self.x[k] - i, self._dx[k]
+        return [column[k] - dy[k] * d / dxk for column, dy in zip(self.columns, self._dys)]
+    
+    def _numpy_segment(self, seg, x3):
+        return (self._np_y[:, seg] - 
+                1.0 * self._np_dy[:, seg] * (self._np_x[seg] - x3) / self._np_dx[seg])
+        
+    def _numpy_evaluate(self, ind, x3):
+        n = len(self._np_x)
+        y_new = self._numpy_segment(np.clip(ind, 0, n - 2), x3)
+        return np.where(ind >= n - 1, self._np_y[:, -1:], y_new)
+    
+    def _numpy_extend(self, x3, below, above, y_new):
+        seg = np.where(above, len(self._np_x) - 2, 0)
+        return np.where(below | above, self._numpy_segment(seg, x3), y_new)
+    
+    def cursor(self):
+        """return a LinearInterpolatorCursor, for streaming / chunked evaluation
+        """
+        return LinearInterpolatorCursor(self)
 
     def interpolate_legacy(self, x_new):
         """Interpolate value to new x axis. O(n*log(n)) implementation. Using binary
         search to find left greatest equal and right smallest value. This is a legacy
-        method and don't use.
+        method and don't use. Single series only.
         """
         if ((x_new[0] < self.lower) or (x_new[-1] > self.upper)):
             raise ValueError
@@ -107,53 +356,365 @@ class LinearInterpolator():
         """given 2 points (x1, y1), (x2, y2), find y3 for x3.
         """
         return y1 - 1.0 * (y1 - y2) * (x1 - x3) / (x1 - x2)
+
+class PreviousInterpolator(BaseInterpolator):
+    """Step interpolator, y of the nearest x on the left (x[k] <= x_new). 
+    See BaseInterpolator for arguments.
+    """
+    __slots__ = ()
+    
+    def _values(self, k, i):
+        return [column[k] for column in self.columns]
+    
+    def _numpy_evaluate(self, ind, x3):
+        return self._np_y[:, np.clip(ind, 0, len(self._np_x) - 1)]
+
+class NextInterpolator(BaseInterpolator):
+    """Step interpolator, y of the nearest x on the right (x[k] >= x_new).
+    See BaseInterpolator for arguments.
+    """
+    __slots__ = ()
+    
+    def _values(self, k, i):
+        if self.x[k] != i:
+            k += 1
+        return [column[k] for column in self.columns]
+    
+    def _numpy_evaluate(self, ind, x3):
+        n = len(self._np_x)
+        ind = np.clip(ind, 0, n - 1)
+        ind = np.where(self._np_x[ind] == x3, ind, np.clip(ind + 1, 0, n - 1))
+        return self._np_y[:, ind]
+
+class NearestInterpolator(BaseInterpolator):
+    """y of the nearest x, ties go to the left, the same as 
+    angora.DATA.binarysearch.find_nearest. See BaseInterpolator for arguments.
+    """
+    __slots__ = ()
+    
+    def _values(self, k, i):
+        x = self.x
+        if (k < len(x) - 1) and ((i - x[k]) > (x[k+1] - i)):
+            k += 1
+        return [column[k] for column in self.columns]
+    
+    def _numpy_evaluate(self, ind, x3):
+        n = len(self._np_x)
+        seg = np.clip(ind, 0, n - 2)
+        x = self._np_x
+        ind = np.where((x3 - x[seg]) > (x[seg+1] - x3), seg + 1, seg)
+        return self._np_y[:, np.where(x3 >= x[-1], n - 1, ind)]
+
+def natural_spline_m(x, y):
+    """second derivatives M of natural cubic spline at every knot, M[0] = M[-1] = 0.
+    Solve the tridiagonal system with Thomas algorithm in O(n).
+    
+        h[i-1] * M[i-1] + 2 * (h[i-1] + h[i]) * M[i] + h[i] * M[i+1] 
+            = 6 * ((y[i+1] - y[i]) / h[i] - (y[i] - y[i-1]) / h[i-1])
+    """
+    n = len(x)
+    m = [0.0] * n
+    if n < 3:
+        return m
+    h = [x[k+1] - x[k] for k in range(n - 1)]
+    cp, dp = [0.0] * n, [0.0] * n # forward sweep
+    for i in range(1, n - 1):
+        a, b, c = h[i-1], 2.0 * (h[i-1] + h[i]), h[i]
+        r = 6.0 * ((y[i+1] - y[i]) / h[i] - (y[i] - y[i-1]) / h[i-1])
+        denom = b - a * cp[i-1]
+        cp[i] = c / denom
+        dp[i] = (r - a * dp[i-1]) / denom
+    for i in range(n - 2, 0, -1): # back substitution
+        m[i] = dp[i] - cp[i] * m[i+1]
+    return m
+
+class CubicSplineInterpolator(BaseInterpolator):
+    """Natural cubic spline interpolator. Coefficients of every segment are built once in 
+    O(n), y = y[k] + t * (b[k] + t * (c[k] + t * d[k])), t = x_new - x[k]. With 
+    extrapolate="linear", it extends along the tangent at the ends. 
+    See BaseInterpolator for arguments.
+    """
+    __slots__ = ("_bs", "_cs", "_ds", "_end_slopes", "_np_b", "_np_c", "_np_d", "_np_slopes")
+    
+    def _build_python(self):
+        x = self.x
+        n = len(x)
+        self._bs, self._cs, self._ds, self._end_slopes = list(), list(), list(), list()
+        for y in self.columns:
+            m = natural_spline_m(x, y)
+            b, c, d = array.array("d"), array.array("d"), array.array("d")
+            for k in range(n - 1):
+                h = x[k+1] - x[k]
+                b.append((y[k+1] - y[k]) / h - h * (2.0 * m[k] + m[k+1]) / 6.0)
+                c.append(m[k] / 2.0)
+                d.append((m[k+1] - m[k]) / (6.0 * h))
+            self._bs.append(b)
+            self._cs.append(c)
+            self._ds.append(d)
+            if n > 1: # (start slope, end slope)
+                h = x[-1] - x[-2]
+                self._end_slopes.append((b[0], b[-1] + h * (2.0 * c[-1] + 3.0 * d[-1] * h)))
+    
+    def _build_numpy(self):
+        BaseInterpolator._build_numpy(self)
+        self._np_b = np.asarray(self._bs, dtype=float)
+        self._np_c = np.asarray(self._cs, dtype=float)
+        self._np_d = np.asarray(self._ds, dtype=float)
+        self._np_slopes = np.asarray(self._end_slopes, dtype=float)
+    
+    def _values(self, k, i):
+        if k == len(self.x) - 1:
+            return [column[k] for column in self.columns]
+        t = i - self.x[k]
+        return [column[k] + t * (b[k] + t * (c[k] + t * d[k])) 
+                for column, b, c, d in zip(self.columns, self._bs, self._cs, self._ds)]
+    
+    def _extend_values(self, i):
+        if i < self.lower:
+            t = i - self.x[0]
+            return [column[0] + slopes[0] * t 
+                    for column, slopes in zip(self.columns, self._end_slopes)]
+        else:
+            t = i - self.x[-1]
+            return [column[-1] + slopes[1] * t 
+                    for column, slopes in zip(self.columns, self._end_slopes)]
+    
+    def _numpy_evaluate(self, ind, x3):
+        n = len(self._np_x)
+        seg = np.clip(ind, 0, n - 2)
+        t = x3 - self._np_x[seg]
+        y_new = self._np_y[:, seg] + t * (self._np_b[:, seg] + 
+                                          t * (self._np_c[:, seg] + t * self._np_d[:, seg]))
+        return np.where(ind >= n - 1, self._np_y[:, -1:], y_new)
+    
+    def _numpy_extend(self, x3, below, above, y_new):
+        y_below = self._np_y[:, :1] + self._np_slopes[:, :1] * (x3 - self._np_x[0])
+        y_above = self._np_y[:, -1:] + self._np_slopes[:, 1:] * (x3 - self._np_x[-1])
+        return np.where(below, y_below, np.where(above, y_above, y_new))
+
+class InterpolatorCursor(object):
+    """A stateful cursor on an interpolator. It remembers the segment where the last
+    x located, so x can be fed as an iterator or in successive sorted chunks, and every
+    chunk resume from the last segment. The source x, y arrays are never copied.
+    
+    Usage::
+    
+        cursor = LinearInterpolator(x, y).cursor()
+        for chunk in chunks: # sorted, and every chunk >= the previous one
+            y_chunk = cursor.feed(chunk)
+            
+        for y_new in LinearInterpolator(x, y).stream(x_iter):
+            ...
+    """
+    def __init__(self, interpolator):
+        self.interpolator = interpolator
+        self.reset()
+    
+    def reset(self):
+        """forget the position, then you can feed from the beginning again
+        """
+        self.index = None # left end index of current segment
+        self.last_x = None
         
-def arange(start=None, end=None, count=None, gap=None):
+    def feed(self, x_chunk):
+        """interpolate a sorted chunk, returns the same container type as x_chunk. For
+        multi series, returns columns the same way as the interpolator does.
+        """
+        return self.interpolator._wrap_rows(x_chunk, list(self.iterate(x_chunk)))
+    
+    def iterate(self, x_iter):
+        """generator, yield interpolated y for every x in x_iter. Raise ValueError if x is
+        smaller than the previous x. Out of range x is handled by the extrapolate policy of
+        the interpolator. For multi series, yield a tuple of y of all series.
+        """
+        f = self.interpolator
+        x, evaluate = f.x, f._evaluate
+        lower, upper = f.lower, f.upper
+        last = len(x) - 1
+        k, last_x = self.index, self.last_x
+        
+        try:
+            for i in x_iter:
+                if (last_x is not None) and (i < last_x):
+                    raise ValueError("x has to be sorted")
+                last_x = i
+                if (i < lower) or (i > upper):
+                    yield f._extrapolate(i)
+                    continue
+                if k is None:
+                    k = max(find_le(x, i), 0)
+                
+                while (k < last) and (x[k+1] <= i):
+                    k += 1
+                yield evaluate(k, i)
+        finally:
+            self.index, self.last_x = k, last_x
+
+class LinearInterpolatorCursor(InterpolatorCursor):
+    """InterpolatorCursor of LinearInterpolator, with the evaluation inlined.
     """
+    def iterate(self, x_iter):
+        f = self.interpolator
+        x, dx = f.x, f._dx
+        single = f.names is None
+        columns, dys = f.columns, f._dys
+        y, dy = columns[0], dys[0]
+        series = list(zip(columns, dys))
+        lower, upper = f.lower, f.upper
+        last = len(x) - 1
+        k, last_x = self.index, self.last_x
+        
+        # y1 - dy * (x1 - x3) / dx is exactly the formula of LinearInterpolator.locate()
+        try:
+            for i in x_iter:
+                if (last_x is not None) and (i < last_x):
+                    raise ValueError("x has to be sorted")
+                last_x = i
+                if (i < lower) or (i > upper):
+                    yield f._extrapolate(i)
+                    continue
+                if k is None:
+                    k = max(find_le(x, i), 0)
+                
+                while (k < last) and (x[k+1] <= i):
+                    k += 1
+                if k == last:
+                    if single:
+                        yield y[k]
+                    else:
+                        yield tuple(column[k] for column in columns)
+                else:
+                    d, dxk = x[k] - i, dx[k]
+                    if single:
+                        yield y[k] - dy[k] * d / dxk
+                    else:
+                        yield tuple(column[k] - dyc[k] * d / dxk for column, dyc in series)
+        finally:
+            self.index, self.last_x = k, last_x
+
+class FloatRange(object):
+    """A lazy, drift-free arithmetic sequence, O(1) memory. The i-th item is computed 
+    directly as start + i * gap, so float error doesn't accumulate. Support len, indexing,
+    slicing, iteration, reversed and membership test. to_array() materialize it into 
+    array.array("d").
+    
+    Usually created by arange().
+    """
+    __slots__ = ("start", "gap", "_offset", "_step", "_count")
+    
+    def __init__(self, start, gap, count, _offset=0, _step=1):
+        self.start = start
+        self.gap = gap
+        self._count = max(int(count), 0)
+        self._offset = _offset # item i is start + (_offset + i * _step) * gap, keep slice
+        self._step = _step     # of slice exactly the same value as the original one
+    
+    def _value(self, i):
+        return self.start + (self._offset + i * self._step) * self.gap
+    
+    def __len__(self):
+        return self._count
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._count)
+            return FloatRange(self.start, self.gap, len(range(start, stop, step)),
+                              self._offset + start * self._step, self._step * step)
+        if index < 0:
+            index += self._count
+        if not (0 <= index < self._count):
+            raise IndexError("FloatRange index out of range")
+        return self._value(index)
+    
+    def __iter__(self):
+        value = self._value
+        for i in range(self._count):
+            yield value(i)
+            
+    def __reversed__(self):
+        value = self._value
+        for i in range(self._count - 1, -1, -1):
+            yield value(i)
+    
+    def index(self, x):
+        """index of x, raise ValueError if x is not in it
+        """
+        if self._count and self.gap:
+            guess = int(round(((x - self.start) / float(self.gap) - self._offset) / self._step))
+            for i in (guess - 1, guess, guess + 1): # tolerate rounding
+                if (0 <= i < self._count) and (self._value(i) == x):
+                    return i
+        elif self._count and (self.start == x):
+            return 0
+        raise ValueError("%r is not in FloatRange" % (x,))
+    
+    def __contains__(self, x):
+        try:
+            self.index(x)
+            return True
+        except ValueError:
+            return False
+    
+    def __repr__(self):
+        return "FloatRange(start=%r, gap=%r, count=%r)" % (
+            self[0] if self._count else self.start, self.gap * self._step, self._count)
+    
+    def to_array(self):
+        """materialize into array.array("d")
+        """
+        return array.array("d", self)
+    
+    def tolist(self):
+        return list(self)
+    
+    def __array__(self, dtype=None):
+        """let numpy.asarray() take the array.array buffer directly
+        """
+        return np.asarray(self.to_array(), dtype=dtype)
+
+def arange(start=None, end=None, count=None, gap=None):
+    """Returns a lazy FloatRange, specify three of:
+    
     start, end, count
-    start, end, freq
-    start, count, freq
-    end, count, freq
+    start, end, gap
+    start, count, gap
+    end, count, gap
+    
+    For start, end, gap, the sequence stops at the last item <= end (>= end for negative gap).
     """
-    if (bool(start) + bool(end) + bool(count) + bool(gap)) != 3:
+    if [start, end, count, gap].count(None) != 1:
         raise Exception("Must specify three of start, end, count or gap")
     
-    array = list()
-    if not start:
-        start = end - count * gap
-        for _ in xrange(count):
-            start += gap
-            array.append(start)
-        return array
-    
-    elif not end:
-        start -= gap
-        for _ in xrange(count):
-            start += gap
-            array.append(start)
-        return array
-    
-    elif not count:
-        start -= gap
-        for _ in xrange(2**28):
-            start += gap
-            if start <= end:
-                array.append(start)
-            else:
-                return array
-                
+    if start is None:
+        start = end - (count - 1) * gap
+        
+    elif end is None:
+        pass
+    
+    elif count is None:
+        if not gap:
+            raise ValueError("gap can not be 0")
+        def in_range(value):
+            return (value <= end) if gap > 0 else (value >= end)
+        count = max(int((end - start) // gap), -1) + 1
+        while in_range(start + count * gap): # fix rounding of floor division
+            count += 1
+        while count and not in_range(start + (count - 1) * gap):
+            count -= 1
+            
     else:
-        gap = 1.0 * (end - start) / (count - 1)
-        start -= gap
-        for _ in xrange(count):
-            start += gap
-            array.append(start)
-        return array
+        if count > 1:
+            gap = 1.0 * (end - start) / (count - 1)
+        else:
+            gap = 0.0
+    
+    return FloatRange(start, gap, count)
 
 
 if __name__ == "__main__":
     import unittest
-    import time
+    import random
+    import timeit
     
     class LinearInterpolatorUnittest(unittest.TestCase):
         def test_functionality(self):
@@ -163,41 +724,192 @@ if __name__ == "__main__":
             x_new = [1, 1.5, 2, 2.5, 3]
             y_new = f(x_new)
             self.assertListEqual(y_new, [3.0, 2.5, 2.0, 1.5, 1.0]) 
+            
+            y_new = f(array.array("d", x_new))
+            self.assertTrue(isinstance(y_new, array.array))
+            self.assertListEqual(y_new.tolist(), [3.0, 2.5, 2.0, 1.5, 1.0])
+            self.assertRaises(ValueError, f, [0.5, 1])
+            self.assertRaises(ValueError, f, [1, 3.5])
+        
+        def test_unsorted_and_extrapolate(self):
+            x = [i * 0.37 for i in range(100)]
+            y = [(i % 17) * 1.3 - i * 0.01 for i in range(100)]
+            x_new = [random.uniform(x[0], x[-1]) for _ in range(1000)] + [x[0], x[-1]]
+            random.shuffle(x_new)
+            f = LinearInterpolator(x, y, engine="python")
+            self.assertListEqual(f(x_new), f.interpolate_legacy(x_new))
+            
+            x, y = [1, 2, 3], [3, 2, 1]
+            x_new = [4, 0, 2.5, 1]
+            self.assertRaises(ValueError, LinearInterpolator(x, y), x_new)
+            self.assertListEqual(LinearInterpolator(x, y, extrapolate="clamp")(x_new),
+                                 [1, 3, 1.5, 3])
+            self.assertListEqual(LinearInterpolator(x, y, extrapolate="linear")(x_new),
+                                 [0.0, 4.0, 1.5, 3.0])
+            y_new = LinearInterpolator(x, y, extrapolate="nan")(x_new)
+            self.assertTrue(y_new[0] != y_new[0] and y_new[1] != y_new[1])
+            self.assertListEqual(y_new[2:], [1.5, 3.0])
+            self.assertListEqual(LinearInterpolator(x, [y, x], extrapolate="clamp")(x_new),
+                                 [[1, 3, 1.5, 3], [3, 1, 2.5, 1]])
+            self.assertListEqual(
+                list(LinearInterpolator(x, y, extrapolate="clamp").stream([0, 1.5, 5])),
+                [3, 2.5, 1])
+            
+            if np is not None:
+                for policy in ["clamp", "linear"]:
+                    self.assertListEqual(
+                        LinearInterpolator(x, y, engine="numpy", extrapolate=policy)(x_new),
+                        LinearInterpolator(x, y, engine="python", extrapolate=policy)(x_new))
+        
+        def test_cursor(self):
+            x = [i * 0.37 for i in range(1000)]
+            y = [(i % 17) * 1.3 - i * 0.01 for i in range(1000)]
+            x_new = [i * 0.0911 for i in range(int(x[-1] / 0.0911) + 1)] + [x[-1]]
+            f = LinearInterpolator(x, y, engine="python")
+            expect = f(x_new)
+            self.assertListEqual(f.interpolate_legacy(x_new), expect)
+            self.assertListEqual(list(f.stream(iter(x_new))), expect)
+            
+            cursor = f.cursor()
+            y_new = list()
+            for i in range(0, len(x_new), 333):
+                y_new.extend(cursor.feed(x_new[i:i+333]))
+            self.assertListEqual(y_new, expect)
+            self.assertRaises(ValueError, cursor.feed, [1.0]) # smaller than previous x
+            
+            cursor.reset()
+            self.assertListEqual(cursor.feed(x_new[100:200]), expect[100:200])
+            self.assertRaises(ValueError, list, f.stream([1.0, 1000.0]))
+        
+        def test_multi_series(self):
+            x = [i * 0.37 for i in range(100)]
+            y1 = [(i % 17) * 1.3 - i * 0.01 for i in range(100)]
+            y2 = [i * i for i in range(100)]
+            x_new = [i * 0.0911 for i in range(int(x[-1] / 0.0911) + 1)] + [x[-1]]
+            expect1 = LinearInterpolator(x, y1)(x_new)
+            expect2 = LinearInterpolator(x, y2)(x_new)
+            
+            f = LinearInterpolator(x, [y1, y2])
+            self.assertListEqual(f(x_new), [expect1, expect2])
+            f = LinearInterpolator(x, {"a": y1, "b": y2})
+            self.assertEqual(f(x_new), {"a": expect1, "b": expect2})
+            self.assertEqual(f.cursor().feed([]), {"a": [], "b": []})
+            self.assertListEqual(list(f.stream(x_new[:3])), 
+                                 list(zip(expect1[:3], expect2[:3])))
+            self.assertFalse(hasattr(f, "__dict__"))
+        
+        @unittest.skipIf(np is None, "numpy is not installed")
+        def test_numpy_engine(self):
+            x = [i * 0.37 for i in range(1000)]
+            y = [(i % 17) * 1.3 - i * 0.01 for i in range(1000)]
+            x_new = [i * 0.0911 for i in range(int(x[-1] / 0.0911) + 1)] + [x[-1]]
+            f_python = LinearInterpolator(x, y, engine="python")
+            f_numpy = LinearInterpolator(x, y, engine="numpy")
+            self.assertListEqual(f_numpy(x_new), f_python(x_new))
+            self.assertTrue(isinstance(f_numpy(np.array(x_new)), np.ndarray))
+            self.assertRaises(ValueError, f_numpy, [-1.0, 0.0])
     
         def test_performance(self): # 0.155 ~ 0.165
-            x = arange(start=1, end=1000000, gap=1)
-            y = arange(start=1, end=1000000, gap=1)
-            x_new = arange(start=1, end=1000000, gap=0.8731)
+            x = arange(start=1, end=1000000, gap=1).tolist()
+            y = arange(start=1, end=1000000, gap=1).tolist()
+            x_new = arange(start=1, end=1000000, gap=0.8731).tolist()
             
-            st = time.clock()
+            st = timeit.default_timer()
             f = LinearInterpolator(x, y)
             y_new1 = f(x_new)
-            print(time.clock()-st)
+            print(timeit.default_timer()-st)
             
-            st = time.clock()
+            st = timeit.default_timer()
             f = LinearInterpolator(x, y)
             y_new2 = f.interpolate_legacy(x_new)
-            print(time.clock()-st)
+            print(timeit.default_timer()-st)
             
             self.assertListEqual(y_new1, y_new2)
             
-    class arangeUnittest():
+    class KindsUnittest(unittest.TestCase):
+        def test_step_kinds(self):
+            x, y = [1, 2, 3], [10, 20, 30]
+            x_new = [1, 1.4, 1.5, 1.6, 2, 3]
+            self.assertListEqual(PreviousInterpolator(x, y)(x_new), [10, 10, 10, 10, 20, 30])
+            self.assertListEqual(NextInterpolator(x, y)(x_new), [10, 20, 20, 20, 20, 30])
+            self.assertListEqual(NearestInterpolator(x, y)(x_new), [10, 10, 10, 20, 20, 30])
+            self.assertListEqual(
+                NearestInterpolator(x, y, extrapolate="linear")([3.5, 0, 1.6]), [30, 10, 20])
+            self.assertEqual(NextInterpolator(x, {"a": y, "b": x})(x_new[::-1]),
+                             {"a": [30, 20, 20, 20, 20, 10], "b": [3, 2, 2, 2, 2, 1]})
+            
+        def test_cubic_spline(self):
+            f = CubicSplineInterpolator([0, 1, 2], [0, 1, 0], extrapolate="linear")
+            self.assertListEqual(f([0, 0.5, 1, 1.5, 2]), [0, 0.6875, 1, 0.6875, 0])
+            self.assertListEqual(f([-1, 3]), [-1.5, -1.5])
+            
+            x = [i * 0.5 for i in range(20)]
+            f = CubicSplineInterpolator(x, [[2 * i + 1 for i in x], [-i for i in x]])
+            for y1, y2, i in zip(*(f([0.1, 3.3, 7.7]) + [[0.1, 3.3, 7.7]])):
+                self.assertAlmostEqual(y1, 2 * i + 1)
+                self.assertAlmostEqual(y2, -i)
+            
+            # int x with spacing > 1, and int y, needs true division
+            x, y = [0, 3, 6, 9, 12], [0, 7, 2, 5, 1]
+            f, g = CubicSplineInterpolator(x, y), CubicSplineInterpolator(
+                [float(i) for i in x], [float(i) for i in y])
+            x_new = [0, 1, 4.5, 8, 10, 12]
+            self.assertListEqual(f(x_new), g(x_new))
+            for m, expect in zip(natural_spline_m(x, y), [0, -73/28., 17/7., -149/84., 0]):
+                self.assertAlmostEqual(m, expect)
+            self.assertRaises(TypeError, BaseInterpolator, x, y)
+        
+        @unittest.skipIf(np is None, "numpy is not installed")
+        def test_numpy_engine(self):
+            x = [i * 0.37 for i in range(100)]
+            y = [(i % 17) * 1.3 - i * 0.01 for i in range(100)]
+            x_new = [random.uniform(-5, 40) for _ in range(1000)] + [x[0], x[-1]]
+            for kind in [LinearInterpolator, PreviousInterpolator, NextInterpolator, 
+                         NearestInterpolator, CubicSplineInterpolator]:
+                for policy in ["clamp", "linear"]:
+                    self.assertListEqual(
+                        kind(x, y, engine="numpy", extrapolate=policy)(x_new),
+                        kind(x, y, engine="python", extrapolate=policy)(x_new))
+    
+    class arangeUnittest(unittest.TestCase):
         def test_functionality(self):
             self.assertListEqual(
-                arange(end=10, count=10, gap=1),
+                list(arange(end=10, count=10, gap=1)),
                 [1,2,3,4,5,6,7,8,9,10],
                 )
             self.assertListEqual(
-                arange(start=1, count=10, gap=1),
+                list(arange(start=1, count=10, gap=1)),
                 [1,2,3,4,5,6,7,8,9,10],
                 )
             self.assertListEqual(
-                arange(start=1, end=10, gap=1),
+                list(arange(start=1, end=10, gap=1)),
                 [1,2,3,4,5,6,7,8,9,10],
                 )
             self.assertListEqual(
-                arange(start=1, end=10, count=10),
+                list(arange(start=1, end=10, count=10)),
                 [1,2,3,4,5,6,7,8,9,10],
                 )
+            self.assertListEqual(list(arange(start=0, end=1, gap=0.1)), 
+                                 [i * 0.1 for i in range(11)])
+            self.assertListEqual(list(arange(start=3, end=0, gap=-1)), [3, 2, 1, 0])
+            self.assertListEqual(list(arange(start=3, end=0, gap=1)), [])
+        
+        def test_sequence(self):
+            r = arange(start=0, end=1000000, gap=0.5)
+            self.assertEqual(len(r), 2000001)
+            self.assertEqual(r[-1], 1000000)
+            self.assertEqual(r[3], 1.5)
+            self.assertRaises(IndexError, r.__getitem__, 2000001)
+            self.assertListEqual(list(r[10:20:3]), [5, 6.5, 8, 9.5])
+            self.assertListEqual(list(r[20:10:-3]), [10, 8.5, 7, 5.5])
+            self.assertListEqual(list(r[10:20:3][::-1]), [9.5, 8, 6.5, 5])
+            self.assertListEqual(list(reversed(r[:3])), [1, 0.5, 0])
+            self.assertTrue(999.5 in r)
+            self.assertFalse(999.25 in r)
+            self.assertEqual(r.index(999.5), 1999)
+            self.assertListEqual(r[:3].to_array().tolist(), [0, 0.5, 1])
+            
+            f = LinearInterpolator([0, 10], [0, 100])
+            self.assertListEqual(f(arange(start=0, end=10, count=5)), [0, 25, 50, 75, 100])
             
     unittest.main()
@@ -13,17 +13,104 @@ Compatibility
 
 Prerequisites
 -------------
-    statistics: A Python 2.* port of 3.4 Statistics Module
+    statistics: A Python 2.* port of 3.4 Statistics Module, optional, only needed by the
+        exact mode (exact=True, or data other than int and float)
+    numpy: optional, used by the robust criteria for large arrays
 
 Import Command
 --------------
-    from angora.DATASCI.outlier import find_outlier, clear_outlier_onetime, clear_outlier_literally
+    from angora.DATASCI.outlier import (find_outlier, clear_outlier_onetime, 
+        clear_outlier_literally, RunningStats, find_outlier_stream, OnlineOutlierDetector,
+        rolling_outlier, rolling_outlier_mad, fast_mean_stdev, quickselect, quantile, median_mad,
+        find_outlier_mad, clear_outlier_mad, find_outlier_iqr, clear_outlier_iqr,
+        find_outlier_grouped)
 """
 
 from __future__ import print_function
-from statistics import mean, stdev
+from collections import deque
+from fractions import Fraction
+import itertools
+import array as _array
+import random
+import bisect
+import math
+import sys
 
-def find_outlier(array, outlier_criterion = 2):
+try:
+    from statistics import mean, stdev
+except ImportError:
+    mean, stdev = None, None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+is_py2 = (sys.version_info[0] == 2)
+if is_py2:
+    int_types = (int, long)
+else:
+    int_types = (int,)
+fast_types = frozenset(int_types + (float,))
+
+_SQUARE_MIN = 1e-290 # below it, squares of deviations may be subnormal
+
+def _fsum_mean(values):
+    """mean of a non-empty list of float, fsum then one correction pass. fsum(x) / n 
+    rounds twice, so [0.7] * 6 gives 0.6999999999999998. The residuals x - m are exact
+    for values close to m, and adding their mean fixes it.
+    """
+    n = len(values)
+    m = math.fsum(values) / n
+    return m + math.fsum([x - m for x in values]) / n
+
+def fast_mean_stdev(array):
+    """mean and sample standard deviation in float arithmetic. Both sums are done by 
+    math.fsum, which is exact until the final rounding, and the variance is computed 
+    around the mean (two pass), so there's no catastrophic cancellation. The result 
+    agrees with statistics.mean / stdev to a few ulps, but much faster, because 
+    statistics converts every number to Fraction.
+    
+    The mean gets one correction pass, see _fsum_mean(), so constant data like 
+    [0.7] * 6 has exactly its value as mean and 0.0 as stdev.
+    
+    If the squares overflow (data around 1e160) or lose precision in the subnormal range
+    (data around 1e-170), deviations are divided by the largest one before squaring.
+    """
+    if not isinstance(array, (list, tuple)):
+        array = list(array)
+    n = len(array)
+    if n < 2:
+        raise ValueError("variance requires at least two data points")
+    m = _fsum_mean(array)
+    try:
+        ss = math.fsum([(x - m) ** 2 for x in array])
+    except OverflowError:
+        ss = float("inf")
+    if (ss < _SQUARE_MIN) or (ss == float("inf")):
+        scale = max([abs(x - m) for x in array])
+        if not scale: # constant data
+            return m, 0.0
+        ss = math.fsum([((x - m) / scale) ** 2 for x in array])
+        return m, scale * math.sqrt(ss / (n - 1))
+    return m, math.sqrt(ss / (n - 1))
+
+def _mean_stdev(array):
+    if mean is None:
+        raise ImportError("exact mode requires the statistics package")
+    return mean(array), stdev(array)
+
+def _choose_mean_stdev(array, exact):
+    """exact=None means fast_mean_stdev if all items are int or float, else the exact
+    statistics.mean / stdev.
+    """
+    if exact is None:
+        exact = not all(type(x) in fast_types for x in array)
+    if exact:
+        return _mean_stdev
+    return fast_mean_stdev
+
+def find_outlier(array, outlier_criterion = 2, exact = None, workers = None):
     """return list of outliers
     [Args]
     ------
@@ -31,19 +118,32 @@ def find_outlier(array, outlier_criterion = 2):
      
         outlier_criterion: sample with n of standard deviation bias 
             from mean value will be considered as outlier
+        
+        exact: None (default) means use fast_mean_stdev() for int and float data, and 
+            statistics.mean / stdev for others (Decimal, Fraction). True to force the
+            exact statistics package, False to force the fast float mode.
+        
+        workers: number of processes, default None means single process. See 
+            _parallel_mask(). Ignored in exact mode. Workers score float (double) copies
+            of the values, so int beyond 2**53 loses precision, use workers=None for 
+            such data. The returned items are always the original ones.
      
     [Returns]
     ---------
         outliers: list of outliers, maintain the order in original array
     """
-    m, std = mean(array), stdev(array)
+    mean_stdev = _choose_mean_stdev(array, exact)
+    if (workers is not None) and (workers > 1) and (mean_stdev is fast_mean_stdev):
+        return list(itertools.compress(
+            array, _parallel_mask(array, outlier_criterion, workers, True)))
+    m, std = mean_stdev(array)
     outliers = list()
     for i in array:
         if abs(i - m) > outlier_criterion * std:
             outliers.append(i)
     return outliers
 
-def clear_outlier_onetime(array, outlier_criterion = 2):
+def clear_outlier_onetime(array, outlier_criterion = 2, exact = None, workers = None):
     """remove outliers by criterion then returns.
     [Args]
     ------
@@ -51,19 +151,29 @@ def clear_outlier_onetime(array, outlier_criterion = 2):
      
         outlier_criterion: sample with n of standard deviation bias 
             from mean value will be considered as outlier
+        
+        exact: None (default) means use fast_mean_stdev() for int and float data, and 
+            statistics.mean / stdev for others (Decimal, Fraction). True to force the
+            exact statistics package, False to force the fast float mode.
+        
+        workers: see find_outlier()
      
     [Returns]
     ---------
         clean_array: array with all outliers deleted
     """
-    m, std = mean(array), stdev(array)
+    mean_stdev = _choose_mean_stdev(array, exact)
+    if (workers is not None) and (workers > 1) and (mean_stdev is fast_mean_stdev):
+        return list(itertools.compress(
+            array, _parallel_mask(array, outlier_criterion, workers, False)))
+    m, std = mean_stdev(array)
     clean_array = list()
     for i in array:
         if abs(i - m) <= outlier_criterion * std:
             clean_array.append(i)
     return clean_array
     
-def clear_outlier_literally(array, outlier_criterion = 2):
+def clear_outlier_literally(array, outlier_criterion = 2, exact = None):
     """recurrsively remove outliers, until there's no outliers at all. Then return.
     [Args]
     ------
@@ -71,19 +181,778 @@ def clear_outlier_literally(array, outlier_criterion = 2):
      
         outlier_criterion: sample with n of standard deviation bias 
             from mean value will be considered as outlier
+        
+        exact: see find_outlier()
      
     [Returns]
     ---------
         array: array with all outliers deleted, and there's no more outliers can be found
+        
+    For int and float data, this is done by _peel_outlier_sorted() in O(n*log(n)),
+    otherwise clear_outlier_onetime() is repeated until nothing can be removed.
+    """
+    mean_stdev = _choose_mean_stdev(array, exact)
+    try:
+        return _peel_outlier_sorted(array, outlier_criterion, mean_stdev)
+    except _NotSupported:
+        return _clear_outlier_literally_loop(array, outlier_criterion, exact)
+
+#########################
+# Multi process scoring #
+#########################
+
+_shared = None # the data, in every worker process
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+def _chunk_moments(bounds):
+    """(count, mean, m2) of _shared[start:stop]
+    """
+    start, stop = bounds
+    chunk = _shared[start:stop]
+    m = _fsum_mean(chunk)
+    return len(chunk), m, math.fsum([(x - m) ** 2 for x in chunk])
+
+def _chunk_mask(args):
+    """bytearray, 1 for outlier (or for kept value if outlier is False)
+    """
+    start, stop, m, cutoff, outlier = args
+    chunk = _shared[start:stop]
+    if outlier:
+        return bytearray(abs(x - m) > cutoff for x in chunk)
+    else:
+        return bytearray(abs(x - m) <= cutoff for x in chunk)
+
+def _parallel_mask(array, outlier_criterion, workers, outlier):
+    """Score array in worker processes, two rounds:
+    
+        1. every worker computes (count, mean, M2) of its chunks, they're merged by the
+           parallel variance formula (RunningStats.merge).
+        2. every worker compares its chunks to the global mean and stdev, and returns a
+           mask. Masks are concatenated in chunk order, so the original order is kept.
+    
+    The data is copied once into a shared memory double array, which workers get when 
+    they start, so a task is only (start, stop), nothing big is pickled. Only worth it 
+    for millions of values; the result may differ from the single process one only 
+    for values within a few ulps of the cutoff. int is converted to double, exact only
+    up to 2**53.
+    
+    multiprocessing and ctypes are imported here, so the module still imports where 
+    they're not available (IronPython).
+    """
+    from multiprocessing import Pool as ProcessPool
+    from multiprocessing.sharedctypes import RawArray
+    import ctypes
+    
+    n = len(array)
+    if n < 2:
+        raise ValueError("variance requires at least two data points")
+    buffer = _array.array("d", array)
+    shared = RawArray(ctypes.c_double, n)
+    ctypes.memmove(shared, buffer.buffer_info()[0], n * buffer.itemsize)
+    del buffer
+    
+    n_chunks = min(workers * 4, n)
+    edges = [n * i // n_chunks for i in range(n_chunks + 1)]
+    bounds = [(start, stop) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+    
+    pool = ProcessPool(workers, initializer=_init_worker, initargs=(shared,))
+    try:
+        stats = RunningStats()
+        for count, m, m2 in pool.map(_chunk_moments, bounds):
+            stats.merge(RunningStats.from_moments(count, m, m2))
+        cutoff = outlier_criterion * stats.stdev
+        masks = pool.map(_chunk_mask, 
+            [(start, stop, stats.mean, cutoff, outlier) for start, stop in bounds])
+    finally:
+        pool.terminate()
+        pool.join()
+    return bytearray().join(masks)
+
+def _clear_outlier_literally_loop(array, outlier_criterion = 2, exact = None):
+    """reference implementation of clear_outlier_literally, O(k*n)
     """
     while 1:
         length = len(array)
-        array = clear_outlier_onetime(array, outlier_criterion)
+        array = clear_outlier_onetime(array, outlier_criterion, exact)
         if length == len(array):
             return array
-  
+
+class _NotSupported(Exception):
+    """data type is not supported by the fast engine"""
+
+def _exact_scale(array):
+    """every int and finite float is n / 2**e exactly. Returns a common denominator
+    D, so x * D is an integer for every x. Raise _NotSupported for other data.
+    """
+    denominator = 1
+    for x in array:
+        if isinstance(x, float):
+            if math.isinf(x) or math.isnan(x):
+                raise _NotSupported
+            denominator = max(denominator, x.as_integer_ratio()[1])
+        elif not isinstance(x, int_types):
+            raise _NotSupported
+    return denominator
+
+def _sqrt_fraction(f):
+    """math.sqrt(float(f)), but f is scaled by a power of 4 into float range first, so
+    a variance like 1e320 (std 1e160) doesn't overflow, and 1e-340 (std 1e-170) doesn't 
+    underflow to 0. Within float range the result is exactly the same.
+    """
+    if not f:
+        return 0.0
+    e = (f.numerator.bit_length() - f.denominator.bit_length()) // 2
+    if e >= 0:
+        f = f / 4**e
+    else:
+        f = f * 4**(-e)
+    return math.ldexp(math.sqrt(float(f)), e)
+
+def _peel_outlier_sorted(array, outlier_criterion, mean_stdev):
+    """Sort once, then keep running sums of x and x**2 of the kept values, and peel 
+    outliers from both ends, pass by pass, until nothing is peeled. Because a pass 
+    keeps mean - k*std <= x <= mean + k*std, the kept values are always a contiguous
+    range of the sorted values. Every pass is O(1) plus the number of peeled values.
+    
+    The sums are exact (integers, scaled by a common power of 2), so mean and stdev of 
+    every pass are accurate to the last bit. If any value sits so close to the cutoff 
+    that rounding may matter, mean_stdev(kept values) is called to decide that pass 
+    exactly the same way as clear_outlier_onetime(). So the result is the same as 
+    repeating clear_outlier_onetime(), in the original order.
+    """
+    denominator = _exact_scale(array)
+    def scaled(x):
+        if isinstance(x, float):
+            n, d = x.as_integer_ratio()
+            return n * (denominator // d)
+        return x * denominator
+    
+    values = sorted(array)
+    sx, sxx = 0, 0
+    for x in values:
+        v = scaled(x)
+        sx += v
+        sxx += v * v
+    
+    lo, hi = 0, len(values)
+    while 1:
+        count = hi - lo
+        if count < 2:
+            mean_stdev(values[lo:hi]) # raise the same error as mean_stdev
+        m = float(Fraction(sx, count * denominator))
+        std = _sqrt_fraction(Fraction(count * sxx - sx * sx, 
+                                      count * (count - 1) * denominator * denominator))
+        
+        def peel(m, cutoff):
+            new_lo, new_hi = lo, hi
+            while (new_lo < new_hi) and (abs(values[new_lo] - m) > cutoff):
+                new_lo += 1
+            while (new_hi > new_lo) and (abs(values[new_hi-1] - m) > cutoff):
+                new_hi -= 1
+            return new_lo, new_hi
+        
+        cutoff = outlier_criterion * std
+        new_lo, new_hi = peel(m, cutoff)
+        boundary = [values[i] for i in (new_lo - 1, new_lo, new_hi - 1, new_hi) if lo <= i < hi]
+        for x in boundary:
+            if abs(abs(x - m) - cutoff) <= 1e-9 * (abs(x) + abs(m) + cutoff):
+                m, std = mean_stdev(values[lo:hi])
+                new_lo, new_hi = peel(m, outlier_criterion * std)
+                break
+        
+        if (new_lo == lo) and (new_hi == hi):
+            break
+        for x in itertools.chain(values[lo:new_lo], values[new_hi:hi]):
+            v = scaled(x)
+            sx -= v
+            sxx -= v * v
+        lo, hi = new_lo, new_hi
+    
+    if lo == hi:
+        return list()
+    lower, upper = values[lo], values[hi-1]
+    return [x for x in array if lower <= x <= upper]
+
+#############
+# Streaming #
+#############
+
+class RunningStats(object):
+    """Online mean and variance in one pass, Welford algorithm. Numerically stable, and
+    no need to keep the data in memory.
+    
+    [Args]
+    ------
+        compensated: boolean, default False. If True, the updates of mean and sum of
+            squared deviations are Kahan compensated, a little slower but more accurate
+            for very long streams.
+    
+    Usage::
+    
+        stats = RunningStats()
+        for x in readings:
+            stats.update(x)
+        stats.mean, stats.stdev
+    """
+    __slots__ = ("count", "mean", "m2", "compensated", "_c_mean", "_c_m2")
+    
+    def __init__(self, compensated=False):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # sum of squared deviations from mean
+        self.compensated = compensated
+        self._c_mean = 0.0 # Kahan compensations
+        self._c_m2 = 0.0
+        
+    def update(self, x):
+        """add one value
+        """
+        self.count += 1
+        delta = x - self.mean
+        if self.compensated:
+            y = delta / self.count - self._c_mean
+            t = self.mean + y
+            self._c_mean = (t - self.mean) - y
+            self.mean = t
+            y = delta * (x - self.mean) - self._c_m2
+            t = self.m2 + y
+            self._c_m2 = (t - self.m2) - y
+            self.m2 = t
+        else:
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+    
+    def extend(self, iterable):
+        """add all values from iterable
+        """
+        for x in iterable:
+            self.update(x)
+        return self
+    
+    @classmethod
+    def from_moments(cls, count, mean, m2, compensated=False):
+        """build from count, mean and sum of squared deviations of some values
+        """
+        stats = cls(compensated)
+        stats.count, stats.mean, stats.m2 = count, mean, m2
+        return stats
+    
+    def merge(self, other):
+        """merge statistics of another RunningStats into this one, as if all its values
+        were added here. Chan's parallel formula, so chunks can be summarized 
+        independently (in different processes) and combined in any order.
+        """
+        if not other.count:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        return self
+    
+    @property
+    def variance(self):
+        """sample variance, the same definition as statistics.variance
+        """
+        if self.count < 2:
+            raise ValueError("variance requires at least two data points")
+        return self.m2 / (self.count - 1)
+    
+    @property
+    def stdev(self):
+        """sample standard deviation, the same definition as statistics.stdev
+        """
+        return math.sqrt(self.variance)
+    
+    def __repr__(self):
+        return "RunningStats(count=%r, mean=%r, m2=%r)" % (self.count, self.mean, self.m2)
+
+def _reiterate(source):
+    """return a new iterator of source. source is a re-iterable like list, or a function
+    returns a new iterator every time called (for example, a function reads a file)
+    """
+    if callable(source):
+        return iter(source())
+    iterator = iter(source)
+    if iterator is source:
+        raise TypeError("source has to be re-iterable, or a function returns a new iterator")
+    return iterator
+
+def find_outlier_stream(source, outlier_criterion = 2, compensated = False):
+    """two-pass streaming version of find_outlier(), generator. The first pass compute 
+    mean and stdev online, the second pass yield outliers. Data is never materialized, so
+    it works for data much larger than RAM.
+    [Args]
+    ------
+        source: re-iterable source of numbers, or a function returns a new iterator 
+            every time called. For example::
+            
+                def readings():
+                    with open("sensor.txt") as f:
+                        for line in f:
+                            yield float(line)
+                            
+                for outlier in find_outlier_stream(readings):
+                    ...
+        
+        outlier_criterion: sample with n of standard deviation bias 
+            from mean value will be considered as outlier
+        
+        compensated: see RunningStats
+        
+    [Yields]
+    --------
+        outliers, maintain the order in original source
+    """
+    stats = RunningStats(compensated).extend(_reiterate(source))
+    m, cutoff = stats.mean, outlier_criterion * stats.stdev
+    for i in _reiterate(source):
+        if abs(i - m) > cutoff:
+            yield i
+
+class OnlineOutlierDetector(object):
+    """single-pass outlier detector for a one-shot stream. Every value is judged against 
+    the mean and stdev of all values seen before it, then it is added to the statistics.
+    
+    [Args]
+    ------
+        outlier_criterion: sample with n of standard deviation bias 
+            from mean value will be considered as outlier
+        
+        min_count: don't judge until this many values are seen, default 2
+        
+        compensated: see RunningStats
+    
+    Usage::
+    
+        detector = OnlineOutlierDetector(outlier_criterion=3, min_count=100)
+        for outlier in detector.detect(readings):
+            ...
+    """
+    def __init__(self, outlier_criterion = 2, min_count = 2, compensated = False):
+        self.outlier_criterion = outlier_criterion
+        self.min_count = max(min_count, 2)
+        self.stats = RunningStats(compensated)
+        
+    def is_outlier(self, x):
+        """judge x against the current statistics, then add x to statistics
+        """
+        stats = self.stats
+        result = (stats.count >= self.min_count) and \
+            (abs(x - stats.mean) > self.outlier_criterion * stats.stdev)
+        stats.update(x)
+        return result
+    
+    def detect(self, iterable):
+        """generator, yield outliers from iterable
+        """
+        is_outlier = self.is_outlier
+        for x in iterable:
+            if is_outlier(x):
+                yield x
+
+###########
+# Rolling #
+###########
+
+MAD_SCALE = 1.4826 # MAD * MAD_SCALE estimates standard deviation for normal distribution
+
+def rolling_outlier(iterable, window = 100, outlier_criterion = 2, min_count = None):
+    """rolling window outlier detection for time series, generator. Every value is judged
+    against the mean and stdev of the previous #window values. The statistics are 
+    updated incrementally when the window moves (Welford add and remove), O(1) per value.
+    Removing values leaves rounding error behind, which never recovers after a level 
+    shift (the error of 1e9 scale data swamps the stdev of 1 scale data). So every 
+    #window steps the statistics are recomputed exactly from the window by math.fsum, 
+    still O(1) amortized.
+    [Args]
+    ------
+        iterable: time series of numbers, can be a one-shot stream
+        
+        window: window size
+     
+        outlier_criterion: sample with n of standard deviation bias 
+            from mean value will be considered as outlier
+        
+        min_count: don't judge until the window has this many values, default #window
+     
+    [Yields]
+    --------
+        (index, value) of outliers
+    """
+    if min_count is None:
+        min_count = window
+    min_count = max(min_count, 2)
+    
+    values = deque()
+    count, m, m2 = 0, 0.0, 0.0
+    removed = 0
+    for index, x in enumerate(iterable):
+        if (count >= min_count) and \
+                (abs(x - m) > outlier_criterion * math.sqrt(max(m2, 0.0) / (count - 1))):
+            yield index, x
+        
+        # add x
+        values.append(x)
+        count += 1
+        delta = x - m
+        m += delta / count
+        m2 += delta * (x - m)
+        
+        # remove the oldest
+        if count > window:
+            old = values.popleft()
+            count -= 1
+            delta = old - m
+            m -= delta / count
+            m2 -= delta * (old - m)
+            removed += 1
+            if removed == window:
+                removed = 0
+                m = _fsum_mean(values)
+                m2 = math.fsum([(v - m) ** 2 for v in values])
+
+def _median_of_sorted(values):
+    n = len(values)
+    half = n // 2
+    if n % 2:
+        return values[half]
+    return (values[half-1] + values[half]) / 2.0
+
+def _kth_of_two(a_get, a_len, b_get, b_len, k):
+    """k-th (0 based) smallest item of the union of two sorted sequences, O(log(n))
+    """
+    lo, hi = max(0, k + 1 - b_len), min(a_len, k + 1)
+    while lo < hi: # find the smallest i, that a[i] >= b[k-i]
+        i = (lo + hi) // 2
+        if a_get(i) < b_get(k - i):
+            lo = i + 1
+        else:
+            hi = i
+    i, j = lo, k + 1 - lo
+    if i == 0:
+        return b_get(j - 1)
+    if j == 0:
+        return a_get(i - 1)
+    return max(a_get(i - 1), b_get(j - 1))
+
+def _median_mad_of_sorted(values):
+    """median and median absolute deviation of a sorted list, O(log(n)). Deviations on
+    the left of median and on the right are two sorted sequences, the MAD is selected 
+    from them without building the deviation list.
+    """
+    n = len(values)
+    med = _median_of_sorted(values)
+    p = bisect.bisect_left(values, med)
+    def left(i): # i-th smallest deviation on the left
+        return med - values[p - 1 - i]
+    def right(i):
+        return values[p + i] - med
+    half = n // 2
+    if n % 2:
+        mad = _kth_of_two(left, p, right, n - p, half)
+    else:
+        mad = (_kth_of_two(left, p, right, n - p, half - 1) + 
+               _kth_of_two(left, p, right, n - p, half)) / 2.0
+    return med, mad
+
+def rolling_outlier_mad(iterable, window = 100, outlier_criterion = 3, min_count = None,
+                        scale = MAD_SCALE):
+    """rolling window robust outlier detection for time series, generator. Every value is
+    judged against the median and MAD (median absolute deviation) of the previous #window
+    values: abs(x - median) > outlier_criterion * scale * MAD. One spike doesn't inflate
+    MAD like it does to stdev.
+    
+    The window is kept sorted, insert and remove by bisect. Median and MAD are then 
+    selected in O(log(window)).
+    [Args]
+    ------
+        iterable: time series of numbers, can be a one-shot stream
+        
+        window: window size
+        
+        outlier_criterion: n of scaled MAD bias from median will be considered as outlier
+        
+        min_count: don't judge until the window has this many values, default #window
+        
+        scale: MAD is multiplied by scale, default 1.4826 makes it comparable to stdev
+        
+    [Yields]
+    --------
+        (index, value) of outliers
+    """
+    if min_count is None:
+        min_count = window
+    min_count = max(min_count, 1)
+    
+    values = deque()
+    ordered = list()
+    for index, x in enumerate(iterable):
+        if len(ordered) >= min_count:
+            med, mad = _median_mad_of_sorted(ordered)
+            if abs(x - med) > outlier_criterion * scale * mad:
+                yield index, x
+        
+        values.append(x)
+        bisect.insort(ordered, x)
+        if len(values) > window:
+            old = values.popleft()
+            del ordered[bisect.bisect_left(ordered, old)]
+
+#################################
+# Robust criteria: MAD and IQR  #
+#################################
+
+NUMPY_THRESHOLD = 10000 # use numpy.partition for array larger than this, if installed
+
+def quickselect(array, k):
+    """k-th (0 based) smallest item of array, expected O(n). Introselect style: the
+    quickselect partitions around a median-of-3 random pivot, and after 2*log2(n) bad 
+    rounds it falls back to sorting the (small) remainder. array is not modified.
+    """
+    n = len(array)
+    if not (0 <= k < n):
+        raise IndexError("k out of range")
+    data = array
+    depth = 2 * n.bit_length()
+    while 1:
+        if (len(data) <= 32) or (depth == 0):
+            return sorted(data)[k]
+        depth -= 1
+        pivot = sorted(random.sample(data, 3))[1] if len(data) >= 3 else data[0]
+        lows = [x for x in data if x < pivot]
+        if k < len(lows):
+            data = lows
+            continue
+        highs = [x for x in data if x > pivot]
+        n_pivot = len(data) - len(lows) - len(highs)
+        if k < len(lows) + n_pivot:
+            return pivot
+        k -= len(lows) + n_pivot
+        data = highs
+
+def _use_numpy(array, use_numpy):
+    if use_numpy is None:
+        return (np is not None) and \
+            (isinstance(array, np.ndarray) or len(array) > NUMPY_THRESHOLD)
+    if use_numpy and (np is None):
+        raise ImportError("numpy is not installed")
+    return bool(use_numpy)
+
+def _order_statistics(array, ks, use_numpy = None):
+    """list of k-th smallest items for every k in ks
+    """
+    if _use_numpy(array, use_numpy):
+        partitioned = np.partition(np.asarray(array, dtype=float), ks)
+        return [float(partitioned[k]) for k in ks]
+    if not isinstance(array, list):
+        array = list(array)
+    return [quickselect(array, k) for k in ks]
+
+def quantile(array, q, use_numpy = None):
+    """q-quantile of array with linear interpolation between order statistics (the same
+    as numpy.percentile default), by selection in O(n) instead of a full sort.
+    [Args]
+    ------
+        array: list of numbers
+        
+        q: float between 0 and 1
+        
+        use_numpy: None (default) means use numpy.partition if numpy is installed and 
+            array is a ndarray or larger than NUMPY_THRESHOLD. True/False to force.
+    """
+    if not (0 <= q <= 1):
+        raise ValueError("q has to be between 0 and 1")
+    h = (len(array) - 1) * q
+    lo = int(math.floor(h))
+    if lo == h:
+        return _order_statistics(array, [lo], use_numpy)[0]
+    lower, upper = _order_statistics(array, [lo, lo + 1], use_numpy)
+    return lower + (h - lo) * (upper - lower)
+
+def _median(array, use_numpy):
+    n = len(array)
+    if n == 0:
+        raise ValueError("median requires at least one data point")
+    if n % 2:
+        return _order_statistics(array, [n // 2], use_numpy)[0]
+    lower, upper = _order_statistics(array, [n // 2 - 1, n // 2], use_numpy)
+    return (lower + upper) / 2.0
+
+def median_mad(array, use_numpy = None):
+    """median and MAD (median absolute deviation) of array in O(n)
+    """
+    med = _median(array, use_numpy)
+    if _use_numpy(array, use_numpy):
+        deviations = np.abs(np.asarray(array, dtype=float) - med)
+    else:
+        deviations = [abs(x - med) for x in array]
+    return med, _median(deviations, use_numpy)
+
+def find_outlier_mad(array, outlier_criterion = 3, scale = MAD_SCALE, use_numpy = None):
+    """return list of outliers by median / MAD criterion. Unlike mean / stdev, one spike
+    doesn't inflate the criterion, so there's no need to iterate.
+    [Args]
+    ------
+        array: list of numbers
+     
+        outlier_criterion: abs(x - median) > outlier_criterion * scale * MAD 
+            will be considered as outlier
+        
+        scale: default 1.4826 makes scale * MAD comparable to stdev
+        
+        use_numpy: see quantile()
+     
+    [Returns]
+    ---------
+        outliers: list of outliers, maintain the order in original array
+    """
+    med, mad = median_mad(array, use_numpy)
+    cutoff = outlier_criterion * scale * mad
+    return [i for i in array if abs(i - med) > cutoff]
+
+def clear_outlier_mad(array, outlier_criterion = 3, scale = MAD_SCALE, use_numpy = None):
+    """remove outliers by median / MAD criterion, see find_outlier_mad()
+    """
+    med, mad = median_mad(array, use_numpy)
+    cutoff = outlier_criterion * scale * mad
+    return [i for i in array if abs(i - med) <= cutoff]
+
+def _iqr_fence(array, k, use_numpy):
+    if _use_numpy(array, use_numpy):
+        array = np.asarray(array, dtype=float)
+    elif not isinstance(array, list):
+        array = list(array)
+    q1, q3 = quantile(array, 0.25, use_numpy), quantile(array, 0.75, use_numpy)
+    iqr = q3 - q1
+    return q1 - k * iqr, q3 + k * iqr
+
+def find_outlier_iqr(array, k = 1.5, use_numpy = None):
+    """return list of outliers by Tukey's fences, out of [Q1 - k*IQR, Q3 + k*IQR]
+    [Args]
+    ------
+        array: list of numbers
+     
+        k: default 1.5, Tukey's "outlier". Use 3 for "far out"
+        
+        use_numpy: see quantile()
+     
+    [Returns]
+    ---------
+        outliers: list of outliers, maintain the order in original array
+    """
+    lower, upper = _iqr_fence(array, k, use_numpy)
+    return [i for i in array if (i < lower) or (i > upper)]
+
+def clear_outlier_iqr(array, k = 1.5, use_numpy = None):
+    """remove outliers by Tukey's fences, see find_outlier_iqr()
+    """
+    lower, upper = _iqr_fence(array, k, use_numpy)
+    return [i for i in array if lower <= i <= upper]
+
+###########
+# Grouped #
+###########
+
+def _group_outliers(args):
+    """(key, series, outlier_criterion, min_count) -> (key, outliers of series)
+    """
+    key, series, outlier_criterion, min_count = args
+    if len(series) < max(min_count, 2):
+        return key, list()
+    m, std = fast_mean_stdev(series)
+    cutoff = outlier_criterion * std
+    return key, [i for i in series if abs(i - m) > cutoff]
+
+def find_outlier_grouped(data, outlier_criterion = 2, min_count = 2, workers = None):
+    """find outliers of many keyed series in one call, every group is judged by its own
+    mean and stdev. Much cheaper than calling find_outlier() for every small series.
+    [Args]
+    ------
+        data: one of
+        
+            1. a mapping of key -> list of numbers, {"device1": [...], ...}
+            2. a re-iterable of (key, value) pairs, or a function returns a new iterator
+               of pairs every time called. Statistics are accumulated per key in one 
+               streaming pass (Welford, a [count, mean, m2] list per key), the second 
+               pass picks outliers. Values are not stored.
+            3. a one-shot iterator of (key, value) pairs, values are gathered by key first
+        
+        outlier_criterion: sample with n of standard deviation bias 
+            from mean value will be considered as outlier
+        
+        min_count: group with less values than this has no outlier, default 2
+        
+        workers: number of processes to spread the groups to, default None means 
+            single process. Data is gathered by key first, like a mapping.
+    
+    [Returns]
+    ---------
+        outliers: dict, key -> list of outliers of that group, in original order. Every
+            key is included.
+    """
+    is_mapping = hasattr(data, "items")
+    if (not is_mapping) and (not callable(data)) and (iter(data) is data):
+        data, is_mapping = _gather_by_key(data), True
+    
+    if (workers is not None) and (workers > 1):
+        if not is_mapping:
+            data = _gather_by_key(_reiterate(data))
+        tasks = [(key, series, outlier_criterion, min_count) for key, series in data.items()]
+        from multiprocessing import Pool as ProcessPool
+        pool = ProcessPool(workers)
+        try:
+            return dict(pool.map(_group_outliers, tasks, 
+                                 chunksize=max(len(tasks) // (workers * 4), 1)))
+        finally:
+            pool.terminate()
+            pool.join()
+    
+    if is_mapping:
+        return dict(_group_outliers((key, series, outlier_criterion, min_count))
+                    for key, series in data.items())
+    
+    groups = dict()
+    for key, x in _reiterate(data):
+        try:
+            acc = groups[key]
+        except KeyError:
+            acc = groups[key] = [0, 0.0, 0.0]
+        acc[0] += 1
+        delta = x - acc[1]
+        acc[1] += delta / acc[0]
+        acc[2] += delta * (x - acc[1])
+    cutoffs = dict()
+    outliers = dict()
+    for key, (count, m, m2) in groups.items():
+        outliers[key] = list()
+        if count >= max(min_count, 2):
+            cutoffs[key] = (m, outlier_criterion * math.sqrt(m2 / (count - 1)))
+    for key, x in _reiterate(data):
+        try:
+            m, cutoff = cutoffs[key]
+        except KeyError:
+            continue
+        if abs(x - m) > cutoff:
+            outliers[key].append(x)
+    return outliers
+
+def _gather_by_key(pairs):
+    groups = dict()
+    for key, x in pairs:
+        try:
+            groups[key].append(x)
+        except KeyError:
+            groups[key] = [x]
+    return groups
+
 if __name__ == "__main__":
     import unittest
+    import random
     
     class OutlierUnittest(unittest.TestCase):
         def setUp(self):
@@ -97,5 +966,221 @@ if __name__ == "__main__":
             
         def test_clear_outlier_literally(self):
             self.assertListEqual(clear_outlier_literally(self.array, 1), [4,5,6])
+    
+        def test_clear_outlier_literally_engine(self):
+            for seed in range(20):
+                rnd = random.Random(seed)
+                array = [rnd.gauss(0, 1) / (rnd.random() + 0.01) for _ in range(300)]
+                if seed % 2:
+                    array = [int(x * 10) for x in array]
+                for criterion, exact in itertools.product([1, 2, 3], [True, False]):
+                    self.assertListEqual(
+                        clear_outlier_literally(array, criterion, exact),
+                        _clear_outlier_literally_loop(array, criterion, exact))
+            self.assertListEqual(clear_outlier_literally([1, 1, 1, 1, 1]), [1, 1, 1, 1, 1])
+            
+            rnd = random.Random(3)
+            for scale in [1e160, 1e-170]: # variance out of float range
+                array = [rnd.gauss(0, 1) * scale for _ in range(50)]
+                expect = _clear_outlier_literally_loop(array, 2, exact=True)
+                self.assertTrue(len(expect) > 2)
+                self.assertListEqual(clear_outlier_literally(array, 2, exact=True), expect)
+            array = [0.1, 0.2, 0.3, 10.0] # 0.1 is right on the cutoff, up to rounding
+            self.assertListEqual(clear_outlier_literally(array, 1, exact=True), [0.2, 0.3])
+            self.assertListEqual(clear_outlier_literally(array, 1, exact=False), 
+                                 _clear_outlier_literally_loop(array, 1, exact=False))
+            
+        def test_exact_mode(self):
+            from decimal import Decimal
+            rnd = random.Random(1)
+            array = [rnd.gauss(1e6, 1) for _ in range(1000)] + [1e6 + 10]
+            m, std = fast_mean_stdev(array)
+            self.assertAlmostEqual(m, mean(array), delta=1e-9)
+            self.assertAlmostEqual(std, stdev(array), delta=1e-9)
+            self.assertListEqual(find_outlier(array, 3), find_outlier(array, 3, exact=True))
+            self.assertRaises(ValueError, fast_mean_stdev, [1.0])
+            self.assertEqual(fast_mean_stdev([2.0, 2.0, 2.0]), (2.0, 0.0))
+            for value in [0.7, 0.1, 1 / 3.0, 1e6 + 0.3, -2.9e-5]: # not exact in binary
+                for n in [2, 3, 6, 7, 1000]:
+                    self.assertEqual(fast_mean_stdev([value] * n), (value, 0.0))
+            self.assertListEqual(find_outlier([0.1] * 3, 0.5), [])
+            self.assertListEqual(clear_outlier_literally([0.7] * 6, 0.5), [0.7] * 6)
+            self.assertListEqual(list(rolling_outlier([0.7] * 200, 20, 3)), [])
+            
+            for scale in [1e160, 1e-170]: # squares out of float range
+                array = [rnd.gauss(0, 1) * scale for _ in range(50)]
+                m, std = fast_mean_stdev(array)
+                self.assertAlmostEqual(m / scale, mean(array) / scale)
+                self.assertAlmostEqual(std / scale, stdev(array) / scale)
+                self.assertListEqual(clear_outlier_literally(array, 2), 
+                                     _clear_outlier_literally_loop(array, 2, exact=True))
+                self.assertListEqual(find_outlier(array, 2), find_outlier(array, 2, exact=True))
+            
+            array = [Decimal(i) for i in self.array] # not int or float, use exact mode
+            self.assertListEqual(clear_outlier_onetime(array, 1), [3,4,5,6,7])
+            self.assertListEqual(clear_outlier_literally(array, 1), [4,5,6])
+            
+    class RollingUnittest(unittest.TestCase):
+        def setUp(self):
+            rnd = random.Random(0)
+            self.series = [i * 0.1 + rnd.gauss(0, 1) for i in range(2000)]
+            self.series[500] += 8
+            self.series[1500] -= 8
+        
+        def test_rolling_outlier(self):
+            window = 50
+            expect = list()
+            for i in range(window, len(self.series)):
+                history = self.series[i-window:i]
+                if abs(self.series[i] - mean(history)) > 3 * stdev(history):
+                    expect.append((i, self.series[i]))
+            result = list(rolling_outlier(iter(self.series), window, 3))
+            self.assertListEqual(result, expect)
+            self.assertTrue((500, self.series[500]) in result)
+            self.assertTrue((1500, self.series[1500]) in result)
+            self.assertListEqual(find_outlier(self.series, 3), []) # drift hides the spikes
+        
+        def test_rolling_outlier_level_shift(self):
+            rnd = random.Random(2)
+            series = [rnd.gauss(1e9, 1e6) for _ in range(1000)] + \
+                [rnd.gauss(0, 1) for _ in range(20000)]
+            planted = [5000, 12345, 20999]
+            for i in planted:
+                series[i] = 8.0
+            result = [i for i, _ in rolling_outlier(series, 100, 4)]
+            for i in planted:
+                self.assertTrue(i in result)
+            self.assertTrue(len([i for i in result if i >= 1100]) < 10)
+        
+        def test_rolling_outlier_mad(self):
+            window = 51
+            expect = list()
+            for i in range(window, len(self.series)):
+                history = sorted(self.series[i-window:i])
+                med = history[window // 2]
+                mad = sorted(abs(x - med) for x in history)[window // 2]
+                if abs(self.series[i] - med) > 3 * MAD_SCALE * mad:
+                    expect.append((i, self.series[i]))
+            result = list(rolling_outlier_mad(iter(self.series), window, 3))
+            self.assertListEqual(result, expect)
+            self.assertTrue((500, self.series[500]) in result)
+        
+        def test_median_mad_of_sorted(self):
+            for n in range(1, 30):
+                values = sorted(random.randint(0, 20) for _ in range(n))
+                med = _median_of_sorted(values)
+                self.assertEqual(_median_mad_of_sorted(values), 
+                                 (med, _median_of_sorted(sorted(abs(x - med) for x in values))))
+    
+    class RobustUnittest(unittest.TestCase):
+        def test_quickselect(self):
+            for n in [1, 2, 5, 33, 1000]:
+                array = [random.randint(0, n // 2) for _ in range(n)]
+                expect = sorted(array)
+                for k in set([0, n // 3, n // 2, n - 1]):
+                    self.assertEqual(quickselect(array, k), expect[k])
+            self.assertRaises(IndexError, quickselect, [1, 2], 2)
+        
+        def test_quantile(self):
+            array = [7, 1, 3, 5, 9]
+            self.assertEqual(quantile(array, 0.5, use_numpy=False), 5)
+            self.assertEqual(quantile(array, 0.25, use_numpy=False), 3)
+            self.assertEqual(quantile(array, 0.1, use_numpy=False), 1.8)
+            self.assertEqual(quantile(array, 1, use_numpy=False), 9)
+        
+        def test_mad_and_iqr(self):
+            array = [10, 11, 9, 10, 12, 8, 10, 100, 11, 9, -50]
+            self.assertEqual(median_mad(array), (10, 1))
+            self.assertListEqual(find_outlier_mad(array), [100, -50])
+            self.assertListEqual(clear_outlier_mad(array), [10, 11, 9, 10, 12, 8, 10, 11, 9])
+            self.assertListEqual(find_outlier_iqr(array), [100, -50])
+            self.assertListEqual(clear_outlier_iqr(array), [10, 11, 9, 10, 12, 8, 10, 11, 9])
+            self.assertListEqual(find_outlier(array), [100]) # -50 is masked by 100
+            
+        @unittest.skipIf(np is None, "numpy is not installed")
+        def test_numpy(self):
+            array = [random.gauss(0, 1) for _ in range(1001)]
+            self.assertEqual(median_mad(array, use_numpy=True), 
+                             median_mad(array, use_numpy=False))
+            self.assertEqual(quantile(array, 0.3, use_numpy=True), 
+                             quantile(array, 0.3, use_numpy=False))
+    
+    class StreamingUnittest(unittest.TestCase):
+        def test_running_stats(self):
+            array = [random.gauss(1000000, 1) for _ in range(10000)]
+            for compensated in [False, True]:
+                stats = RunningStats(compensated).extend(array)
+                self.assertEqual(stats.count, len(array))
+                self.assertAlmostEqual(stats.mean, mean(array), delta=1e-6)
+                self.assertAlmostEqual(stats.stdev, stdev(array), delta=1e-6)
+            self.assertRaises(ValueError, getattr, RunningStats().extend([1]), "stdev")
+        
+        def test_find_outlier_stream(self):
+            array = [1,2,3,4,5,6,7,8,9]
+            self.assertListEqual(list(find_outlier_stream(array, 1)), [1,2,8,9])
+            self.assertListEqual(list(find_outlier_stream(lambda: iter(array), 1)), [1,2,8,9])
+            self.assertRaises(TypeError, list, find_outlier_stream(iter(array)))
+            
+            array = [random.gauss(0, 1) for _ in range(10000)]
+            self.assertListEqual(list(find_outlier_stream(array)), find_outlier(array))
+            
+        def test_online_detector(self):
+            detector = OnlineOutlierDetector(outlier_criterion = 3, min_count = 5)
+            array = [10, 11, 9, 10, 11, 9, 10, 50, 10, 11, -30, 9]
+            self.assertListEqual(list(detector.detect(array)), [50, -30])
+            self.assertEqual(detector.stats.count, len(array))
+        
+        def test_merge(self):
+            array = [random.gauss(100, 5) for _ in range(1000)]
+            stats = RunningStats()
+            for i in range(0, 1000, 300):
+                stats.merge(RunningStats().extend(array[i:i+300]))
+            stats.merge(RunningStats())
+            self.assertEqual(stats.count, 1000)
+            self.assertAlmostEqual(stats.mean, mean(array), delta=1e-9)
+            self.assertAlmostEqual(stats.stdev, stdev(array), delta=1e-9)
+    
+    class GroupedUnittest(unittest.TestCase):
+        def setUp(self):
+            rnd = random.Random(0)
+            self.data = dict()
+            for key in range(50):
+                self.data["device%s" % key] = [rnd.gauss(key, 1) for _ in range(rnd.randint(1, 40))]
+            self.data["device0"].append(100)
+            self.expect = dict()
+            for key, series in self.data.items():
+                self.expect[key] = find_outlier(series, 2) if len(series) >= 2 else []
+            self.pairs = [(key, x) for key, series in self.data.items() for x in series]
+            random.Random(1).shuffle(self.pairs)
+        
+        def assertSameOutliers(self, result):
+            self.assertEqual(set(result), set(self.expect))
+            for key in result:
+                self.assertEqual(len(result[key]), len(self.expect[key]))
+                for a, b in zip(sorted(result[key]), sorted(self.expect[key])):
+                    self.assertAlmostEqual(a, b)
+                
+        def test_mapping(self):
+            self.assertSameOutliers(find_outlier_grouped(self.data))
+            self.assertTrue(100 in find_outlier_grouped(self.data)["device0"])
+            self.assertSameOutliers(find_outlier_grouped(self.data, workers=2))
+        
+        def test_pairs(self):
+            result = find_outlier_grouped(self.pairs)
+            self.assertSameOutliers(result)
+            self.assertDictEqual(find_outlier_grouped(iter(self.pairs)), result)
+            self.assertDictEqual(find_outlier_grouped(lambda: iter(self.pairs)), result)
+            self.assertDictEqual(find_outlier_grouped(self.pairs, workers=2), result)
+            self.assertDictEqual(find_outlier_grouped([("a", 1), ("a", 2), ("b", 3)], 
+                                                      min_count=3), {"a": [], "b": []})
+    
+    class ParallelUnittest(unittest.TestCase):
+        def test_workers(self):
+            array = [random.gauss(0, 1) for _ in range(20001)] + list(range(-10, 11))
+            self.assertListEqual(find_outlier(array, workers=3), find_outlier(array))
+            self.assertListEqual(clear_outlier_onetime(array, workers=3), 
+                                 clear_outlier_onetime(array))
+            self.assertListEqual(find_outlier([1,2,3,4,5,6,7,8,9], 1, workers=2), [1,2,8,9])
+            self.assertListEqual(find_outlier([0.1] * 40, 0.5, workers=2), [])
             
     unittest.main()
\ No newline at end of file